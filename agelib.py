@@ -5,12 +5,44 @@ agelib.py - Utilities for handling Age values
 05/30/2006	lec
         - removed "perintal" and "postnatal immature"
 
+ageMinMax is memoized: input files reuse a small set of distinct age
+strings, so each distinct string is parsed once (see ageMemo).
+bench/agecheck.py checks ageMinMax against the conformance corpus
+bench/agecorpus.txt.
+
+ageMinMaxArray converts a whole column of ages at once.  It returns
+NumPy arrays if NumPy is installed, else array.array objects.
+
 """
 
 import sys
-import re
-import locale
-from locale import atof
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#globals
+
+ageMemo = {}		# age string : (ageMin, ageMax)
+ageMemoSize = 10000	# ageMemo is cleared when it reaches this size
+
+# ages with fixed (ageMin, ageMax) values
+# removed: 'perinatal' (17.00, 22.0), 'postnatal immature' (25.01, 42.0)
+fixedAges = {
+    'Not Specified' : (-1.0, -1.0),
+    'Not Applicable' : (-1.0, -1.0),
+    'embryonic' : (0.0, 21.0),
+    'postnatal' : (21.01, 1846.0),
+    'postnatal newborn' : (21.01, 25.0),
+    'postnatal adult' : (42.01, 1846.0),
+    }
+
+# postnatal time unit : number of days
+postnatalDays = {'week' : 7, 'month' : 30, 'year' : 365}
+
+invalidAge = (-1.0, -1.0)
 
 def ageMinMax (age):
     """Returns tuple of ints (ageMin, ageMax) given an age string
@@ -19,124 +51,167 @@ def ageMinMax (age):
     # INPUTS:     age as string
     # OUTPUTS:     PYTHON-tuple of ints (min, max) for range specification
     # ASSUMES:     
-    # SIDE EFFECTS: 
-    # EXCEPTIONS: 
+    # SIDE EFFECTS: adds the age to ageMemo
+    # EXCEPTIONS: TypeError if age is not a string
     # COMMENTS:  
     # - This code was copied and adapted from Lori's Strains.py script
     #   in the MGI1.0 migration.
     #   See Requirements document for full details
     #   http://kelso:4444/software/mgi1.0/age.html
+    # - an age that cannot be parsed returns (-1.0, -1.0)
     #------------------------------------------------------------------
 
-    #
-    # Convert age to 'ageMin' and 'ageMax' values
-    #
-
-    ageMin = None
-    ageMax = None
-    ageOK = 1
-
-    if age in ['Not Specified', 'Not Applicable']:
-        ageMin = -1.0
-        ageMax = -1.0
-    elif age == 'embryonic':
-        ageMin = 0.0
-        ageMax = 21.0
-#    elif age == 'perinatal':
-#	ageMin = 17.00
-#	ageMax = 22.0
-    elif age == 'postnatal':
-        ageMin = 21.01
-        ageMax = 1846.0
-    elif age == 'postnatal newborn':
-        ageMin = 21.01
-        ageMax = 25.0
-#    elif age == 'postnatal immature':
-#	ageMin = 25.01
-#	ageMax = 42.0
-    elif age == 'postnatal adult':
-        ageMin = 42.01
-        ageMax = 1846.0
-    else:
-        age = re.sub('or ', ',', age)    # 2 or 3 ==> 2,3
-        age = re.sub('and ', ',', age)    # 2 and 3 ==> 2,3
-        age = re.sub('to ', '-', age)    # 2 to 3 ==> 2-3
-#	age = re.sub('+', '', age)	# 2+ ==> 2
-
-        # only split into 3 elements
-        try:
-            ages = str.split(age, ' ', 2)
-            stem = ages[0]
-            timeUnit = ages[1]
-            timeRange = ages[2]
-
-            #
-            # format is 'embryonic day x,y,z...' ==> (min(x,y,z), max(x,y,z))
-            # format is 'embryonic day x-y,z...' ==> (min(x,y,z), max(x,y,z))
-            # format is 'embryonic day x,y-z...' ==> ditto (rpp)
-            #
-            if str.find(timeRange, ',') >= 0:
-                times = str.split(timeRange, ',')
-
-                for i in range(len(times)):
-                    t = x = times[i]
-                    if str.find(t, '-') >= 0:
-                        [x, y] = str.split(t, '-')
-
-                        # rpp: I added this to insure get min/max for
-                        # patterns that end in: ,y-z
-                        # discarding the z's would lose the
-                        # max of each range, yielding y instead of z.
-                        # add the other onto the tail end of list
-                        times.append (atof(y))
-
-                    # replace each element to it's float value
-                    times[i] = atof(x)
-
-                ageMin = min(times)
-                ageMax = max(times)
-
-            #
-            # format is 'embryonic day x-y' ==> (x,y)
-            #
-            elif str.find(timeRange, '-') >= 0:
-                [ageMin, ageMax] = str.split(timeRange, '-')
-                
-                ageMin = atof(ageMin)
-                ageMax = atof(ageMax)
-
-            #
-            # format is 'embryonic day x' ==> (x,x)
-            #
-            else:
-                ageMin = ageMax = atof(timeRange)
-
-            try:
-                if stem == 'postnatal':
-                    if timeUnit == 'day':
-                        ageMin = ageMin + 21.01
-                        ageMax = ageMax + 21.01
-                    elif timeUnit == 'week':
-                        ageMin = ageMin * 7 + 21.01
-                        ageMax = ageMax * 7 + 21.01
-                    elif timeUnit == 'month':
-                        ageMin = ageMin * 30 + 21.01
-                        ageMax = ageMax * 30 + 21.01
-                    elif timeUnit == 'year':
-                        ageMin = ageMin * 365 + 21.01
-                        ageMax = ageMax * 365 + 21.01
-    
-            except:
-                ageOK = 0
-
-        except:
-            ageOK = 0
-
-        if ageMin is None or ageMax is None:
-            ageOK = 0
-
-        if not ageOK:
-                ageMin = -1.0
-                ageMax = -1.0
+    try:
+        return ageMemo[age]
+    except KeyError:
+        pass
+
+    result = parseAge(age)
+
+    if result is None:
+        result = invalidAge
+
+    if len(ageMemo) >= ageMemoSize:
+        ageMemo.clear()
+
+    ageMemo[age] = result
+
+    return result
+
+def parseAge (age):
+    """Returns tuple of floats (ageMin, ageMax) given an age string,
+    or None if the age cannot be parsed
+    """
+    #------------------------------------------------------------------
+    # INPUTS:     age as string
+    # OUTPUTS:     PYTHON-tuple of floats (min, max), or None
+    # ASSUMES:     
+    # SIDE EFFECTS: 
+    # EXCEPTIONS: TypeError if age is not a string
+    # COMMENTS:  
+    # - not memoized; see ageMinMax
+    # - numbers are converted with float(), which is what locale.atof
+    #   did under the default (C) locale, so results do not depend on
+    #   the locale of the calling program
+    #------------------------------------------------------------------
+
+    if age in fixedAges:
+        return fixedAges[age]
+
+    if not isinstance(age, str):
+        raise TypeError('age must be a string, not %s' % (type(age).__name__))
+
+    # 2 or 3 ==> 2,3; 2 and 3 ==> 2,3; 2 to 3 ==> 2-3
+    age = age.replace('or ', ',').replace('and ', ',').replace('to ', '-')
+
+    # only split into 3 elements
+    ages = age.split(' ', 2)
+    if len(ages) < 3:
+        return None
+
+    stem, timeUnit, timeRange = ages
+
+    try:
+        #
+        # format is 'embryonic day x,y,z...' ==> (min(x,y,z), max(x,y,z))
+        # format is 'embryonic day x-y,z...' ==> (min(x,y,z), max(x,y,z))
+        # format is 'embryonic day x,y-z...' ==> ditto (rpp)
+        #
+        if ',' in timeRange:
+            times = timeRange.split(',')
+
+            for i in range(len(times)):
+                t = x = times[i]
+                if '-' in t:
+                    [x, y] = t.split('-')
+
+                    # rpp: I added this to insure get min/max for
+                    # patterns that end in: ,y-z
+                    # discarding the z's would lose the
+                    # max of each range, yielding y instead of z.
+                    # add the other onto the tail end of list
+                    times.append(float(y))
+
+                # replace each element to it's float value
+                times[i] = float(x)
+
+            ageMin = min(times)
+            ageMax = max(times)
+
+        #
+        # format is 'embryonic day x-y' ==> (x,y)
+        #
+        elif '-' in timeRange:
+            [ageMin, ageMax] = timeRange.split('-')
+
+            ageMin = float(ageMin)
+            ageMax = float(ageMax)
+
+        #
+        # format is 'embryonic day x' ==> (x,x)
+        #
+        else:
+            ageMin = ageMax = float(timeRange)
+
+    except ValueError:
+        return None
+
+    if stem == 'postnatal':
+        if timeUnit == 'day':
+            ageMin = ageMin + 21.01
+            ageMax = ageMax + 21.01
+        elif timeUnit in postnatalDays:
+            days = postnatalDays[timeUnit]
+            ageMin = ageMin * days + 21.01
+            ageMax = ageMax * days + 21.01
 
     return (ageMin, ageMax)
+
+def ageMinMaxArray (ages):
+    """Returns (ageMin, ageMax, valid) arrays given a list of age strings
+    """
+    #------------------------------------------------------------------
+    # INPUTS:     ages as a list (or any iterable) of strings
+    # OUTPUTS:     PYTHON-tuple of three arrays, one element per age:
+    #		ageMin (float), ageMax (float),
+    #		valid (1 if the age could be parsed, else 0)
+    #		NumPy arrays (float64, float64, bool) if NumPy is installed,
+    #		else array.array ('d', 'd', 'b')
+    # ASSUMES:     
+    # SIDE EFFECTS: 
+    # EXCEPTIONS: TypeError if an age is not a string
+    # COMMENTS:  
+    # - each distinct age is parsed once and its result fanned out to
+    #   every row; ageMin/ageMax of an invalid age are -1.0, as in ageMinMax
+    #------------------------------------------------------------------
+
+    ages = list(ages)
+
+    # index of each row's age in the list of distinct ages
+    distinct = {}
+    rows = [distinct.setdefault(age, len(distinct)) for age in ages]
+
+    ageMins = []
+    ageMaxs = []
+    valids = []
+
+    for age in distinct:
+        result = parseAge(age)
+        if result is None:
+            ageMins.append(-1.0)
+            ageMaxs.append(-1.0)
+            valids.append(0)
+        else:
+            ageMins.append(result[0])
+            ageMaxs.append(result[1])
+            valids.append(1)
+
+    if numpy is not None:
+        rows = numpy.array(rows, dtype = numpy.intp)
+        return (numpy.array(ageMins, dtype = numpy.float64)[rows],
+                numpy.array(ageMaxs, dtype = numpy.float64)[rows],
+                numpy.array(valids, dtype = numpy.bool_)[rows])
+
+    return (array.array('d', [ageMins[i] for i in rows]),
+            array.array('d', [ageMaxs[i] for i in rows]),
+            array.array('b', [valids[i] for i in rows]))
@@ -8,11 +8,22 @@
 
 import sys
 import os
-import db
+import cachelib
+import errorlib
+import statementlib
+import statslib
 
 #globals
 
-mutantCellLineDict = {}      		# mutant cell line
+mutantCellLineDict = cachelib.cache(__name__, 'mutantCellLineDict')	# mutant cell line
+mutantCellLineMisses = cachelib.missCache('Mutant CellLine')	# invalid mutant cell lines
+
+statementlib.register('verifyMutantCellLine', '''
+                select _CellLine_key, cellLine 
+                from ALL_CellLine
+                where cellLine = $1
+                and isMutant = 1
+                ''')
 
 # Purpose:  verify Mutant Cell Line
 # Returns:  Mutant Cell Line key if valid, else 0
@@ -31,16 +42,16 @@ def verifyMutnatCellLine(
 
     if mutantCellLine in mutantCellLineDict:
         mutantCellLineKey = mutantCellLineDict[mutantCellLine]
+    elif mutantCellLine in mutantCellLineMisses:
+        if errorFile != None:
+            errorlib.report(errorFile, 'Invalid Mutant CellLine (%d): %s\n', lineNum, mutantCellLine)
+        mutantCellLineKey = 0
     else:
-        results = db.sql('''
-                select _CellLine_key, cellLine 
-                from ALL_CellLine
-                where cellLine = '%s'
-                and isMutant = 1
-                ''' % (mutantCellLine), 'auto')
+        results = statementlib.execute('verifyMutantCellLine', mutantCellLine)
         if len(results) == 0:
+            mutantCellLineMisses.add(mutantCellLine)
             if errorFile != None:
-                errorFile.write('Invalid Mutant CellLine (%d): %s\n' % (lineNum, mutantCellLine))
+                errorlib.report(errorFile, 'Invalid Mutant CellLine (%d): %s\n', lineNum, mutantCellLine)
             mutantCellLineKey = 0
         else:
             for r in results:
@@ -49,3 +60,4 @@ def verifyMutnatCellLine(
 
     return mutantCellLineKey
 
+statslib.register(__name__)
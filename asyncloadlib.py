@@ -0,0 +1,345 @@
+#
+# Program: asyncloadlib.py
+#
+# Purpose:
+#
+#	Provide awaitable versions of the verify* functions of loadlib,
+#	sourceloadlib and alleleloadlib, for asyncio-based loads.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	import asyncloadlib
+#
+#	markerKey = await asyncloadlib.verifyMarker(markerID, lineNum, errorFile)
+#	termKey = await asyncloadlib.verifyTerm(termID, '', '', lineNum, errorFile)
+#
+#	Each function takes the arguments of the verifier of the same name
+#	and returns the same key, and writes the same error lines.
+#	sourceloadlib.verifyAge and verifyAges never query the database;
+#	call them directly.
+#
+#	asyncloadlib.setAdapter(adapter) replaces the database adapter
+#	(see ThreadAdapter).
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+# Exit Codes:
+#
+# Assumes:
+#
+#	all calls are made from one event loop
+#	db.sql may be called from several threads at once (see ThreadAdapter)
+#
+# Bugs:
+#
+# Implementation:
+#
+#	A value already in a library's dictionary (or miss cache) is answered
+#	by the synchronous verifier at once, without leaving the event loop.
+#
+#	A value that is not cached is looked up through the adapter, so the
+#	event loop never waits on db.sql:
+#
+#	- for a verifier that has a batch resolver (loadlib.batchResolvers),
+#	  the lookups made during one pass of the event loop are collected
+#	  and resolved by one batch resolver call (one query per chunk);
+#	  the synchronous verifier then answers from the dictionary
+#	- any other verifier is run by the adapter
+#	- a table-backed verifier (Logical DB, Tissue...) has its table
+#	  loaded by the adapter the first time
+#
+#	A lookup of a value that is already being looked up waits for that
+#	lookup instead of issuing a second query.
+#
+
+import sys
+import os
+import asyncio
+import concurrent.futures
+import functools
+import alleleloadlib
+import loadlib
+import sourceloadlib
+import tablelib
+
+#globals
+
+pending = {}		# verify* function name : lookups waiting for the next batch
+inFlight = {}		# lookup key : asyncio.Future, done when the lookup is
+tasks = set()		# running batch tasks (kept so they are not garbage collected)
+
+# Purpose:  the default database adapter
+#	runs the blocking library code (and so db.sql) on a pool of threads
+
+class ThreadAdapter:
+
+    def __init__(self, workers = 4):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers = workers, \
+            thread_name_prefix = 'asyncloadlib')
+
+    async def call(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(function, *args))
+
+adapter = ThreadAdapter()	# database adapter (see setAdapter)
+
+# Purpose:  replaces the database adapter
+# Returns:  nothing
+# Assumes:  the adapter has an "async def call(function, *args)" that
+#	runs function(*args) without blocking the event loop and returns its result
+# Effects:  nothing
+# Throws:  nothing
+
+def setAdapter(
+    newAdapter	# database adapter
+    ):
+
+    global adapter
+
+    adapter = newAdapter
+
+# Purpose:  runs a function through the adapter, once per key at a time
+# Returns:  the result of the function
+# Assumes:  nothing
+# Effects:  a call made while another call with the same key is running
+#	waits for it, then runs, and is answered from the cache (or the
+#	miss cache) the first call filled, so it reports its own line
+# Throws:  whatever the function throws
+
+async def run(
+    key,	# lookup key (tuple)
+    function,	# function to run
+    *args	# its arguments
+    ):
+
+    if key in inFlight:
+        await asyncio.shield(inFlight[key])
+        return await adapter.call(function, *args)
+
+    f = asyncio.get_running_loop().create_future()
+    inFlight[key] = f
+
+    try:
+        return await adapter.call(function, *args)
+    finally:
+        del inFlight[key]
+        f.set_result(None)
+
+# Purpose:  looks up a value with the batch resolver of its verifier
+# Returns:  nothing
+# Assumes:  the verifier has a batch resolver
+# Effects:  adds the lookup to the next batch of the verifier,
+#	unless the same value is already being looked up,
+#	and waits until the batch has been resolved
+# Throws:  whatever the batch resolver throws
+
+async def fetch(
+    verifier,	# verify* function
+    value,	# the value looked up (e.g. (markerID, organism))
+    args	# the arguments of the verifier (tuple)
+    ):
+
+    name = verifier.__name__
+    key = (name, value)
+
+    if key not in inFlight:
+        loop = asyncio.get_running_loop()
+        inFlight[key] = loop.create_future()
+        if name not in pending:
+            pending[name] = []
+            loop.call_soon(flush, name)
+        pending[name].append((loadlib.DeferredKey(verifier, args), key))
+
+    await asyncio.shield(inFlight[key])
+
+# Purpose:  starts the batch of a verifier
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  runs the batch resolver of the verifier on the pending lookups
+# Throws:  nothing
+
+def flush(
+    name	# verify* function name (str.
+    ):
+
+    task = asyncio.ensure_future(resolve(name, pending.pop(name)))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+# Purpose:  resolves a batch of lookups
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  runs the batch resolver through the adapter and wakes up the
+#	lookups waiting for the batch
+# Throws:  nothing
+
+async def resolve(
+    name,	# verify* function name (str.
+    batch	# list of (DeferredKey, lookup key)
+    ):
+
+    error = None
+
+    try:
+        await adapter.call(loadlib.batchResolvers[name], [d for d, key in batch])
+    except Exception as e:
+        error = e
+
+    for d, key in batch:
+        f = inFlight.pop(key)
+        if error is None:
+            f.set_result(None)
+        else:
+            f.set_exception(error)
+
+# Purpose:  loads a lookup table through the adapter
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  fills the table the first time (see tablelib.load)
+# Throws:  nothing
+
+async def loadTable(
+    name,	# table name (str.
+    dictionary	# the table's dictionary
+    ):
+
+    if len(dictionary) == 0:
+        await run(('tablelib.load', name), tablelib.load, name)
+
+#
+# loadlib
+#
+
+async def verifyLogicalDB(logicalDB, lineNum, errorFile):
+    await loadTable('logicalDB', loadlib.logicalDBDict)
+    return loadlib.verifyLogicalDB(logicalDB, lineNum, errorFile)
+
+async def verifyMarker(markerID, lineNum, errorFile, checkDuplicate = 0, organism = 'mouse, laboratory'):
+    args = (markerID, lineNum, errorFile, checkDuplicate, organism)
+    if (markerID, organism) not in loadlib.markerDict and not loadlib.markerMisses.has((markerID, organism)) \
+        and not (markerID in loadlib.markerVerified and checkDuplicate) \
+        and not (organism in loadlib.markerIndex and loadlib.markerNumber(markerID) is not None):
+        await fetch(loadlib.verifyMarker, (markerID, organism), args)
+    return loadlib.verifyMarker(*args)
+
+async def verifyMGIType(mgiType, lineNum, errorFile):
+    await loadTable('mgiType', loadlib.mgiTypeDict)
+    return loadlib.verifyMGIType(mgiType, lineNum, errorFile)
+
+async def verifyObject(objectID, mgiTypeKey, objectDescription, lineNum, errorFile):
+    args = (objectID, mgiTypeKey, objectDescription, lineNum, errorFile)
+    typeKey = loadlib.mgiTypeValue(mgiTypeKey)
+    if (len(objectID) > 0 and (typeKey, objectID) in loadlib.objectDict) \
+        or (len(objectID) == 0 and (typeKey in loadlib.objectDescriptionIndex \
+            or (typeKey, objectDescription) in loadlib.objectDescriptionDict)):
+        return loadlib.verifyObject(*args)
+    return await run(('verifyObject', objectID, mgiTypeKey, objectDescription), loadlib.verifyObject, *args)
+
+async def verifyProbe(probeID, lineNum, errorFile):
+    args = (probeID, lineNum, errorFile)
+    if probeID not in loadlib.probeDict and not loadlib.probeMisses.has(probeID):
+        await fetch(loadlib.verifyProbe, probeID, args)
+    return loadlib.verifyProbe(*args)
+
+async def verifyReference(referenceID, lineNum, errorFile):
+    args = (referenceID, lineNum, errorFile)
+    if referenceID not in loadlib.referenceDict:
+        await fetch(loadlib.verifyReference, referenceID, args)
+    return loadlib.verifyReference(*args)
+
+async def verifyTerm(termID, vocabKey, termDescription, lineNum, errorFile):
+    args = (termID, vocabKey, termDescription, lineNum, errorFile)
+    if len(termID) > 0:
+        if termID not in loadlib.termDict and termID not in loadlib.termIDIndex:
+            await fetch(loadlib.verifyTerm, termID, args)
+    elif (vocabKey, termDescription) not in loadlib.termDict and loadlib.preloadedVocab(vocabKey) is None:
+        return await run(('verifyTerm', vocabKey, termDescription), loadlib.verifyTerm, *args)
+    return loadlib.verifyTerm(*args)
+
+async def verifyUser(userID, lineNum, errorFile):
+    args = (userID, lineNum, errorFile)
+    if userID not in loadlib.userDict:
+        await fetch(loadlib.verifyUser, userID, args)
+    return loadlib.verifyUser(*args)
+
+async def verifyMarkerType(markerType, lineNum, errorFile):
+    await loadTable('markerType', loadlib.markerTypeDict)
+    return loadlib.verifyMarkerType(markerType, lineNum, errorFile)
+
+#
+# sourceloadlib
+#
+
+async def verifyCellLine(cellLine, lineNum, errorFile):
+    await loadTable('cellLine', sourceloadlib.cellLineDict)
+    return sourceloadlib.verifyCellLine(cellLine, lineNum, errorFile)
+
+async def verifyLibrary(libraryName, lineNum, errorFile = None):
+    args = (libraryName, lineNum, errorFile)
+    if not sourceloadlib.libraryLoaded and not sourceloadlib.libraryDeclared:
+        await run(('preloadLibraries',), sourceloadlib.preloadLibraries)
+    if not sourceloadlib.libraryLoaded and libraryName not in sourceloadlib.libraryDict \
+        and not sourceloadlib.libraryMisses.has(libraryName):
+        await fetch(sourceloadlib.verifyLibrary, libraryName, args)
+    return sourceloadlib.verifyLibrary(*args)
+
+async def verifyLibraryID(libraryID, logicalDBKey, lineNum, errorFile = None):
+    try:
+        key = int(logicalDBKey)
+    except (TypeError, ValueError):
+        key = None
+    if key is not None and key not in sourceloadlib.libraryIDDict:
+        await run(('preloadLibraryIDs', key), sourceloadlib.preloadLibraryIDs, [key])
+    return sourceloadlib.verifyLibraryID(libraryID, logicalDBKey, lineNum, errorFile)
+
+async def verifyGender(gender, lineNum, errorFile):
+    await loadTable('gender', sourceloadlib.genderDict)
+    return sourceloadlib.verifyGender(gender, lineNum, errorFile)
+
+async def verifyOrganism(organism, lineNum, errorFile):
+    if organism in sourceloadlib.organismDict or sourceloadlib.organismMisses.has(organism):
+        return sourceloadlib.verifyOrganism(organism, lineNum, errorFile)
+    return await run(('verifyOrganism', organism), sourceloadlib.verifyOrganism, organism, lineNum, errorFile)
+
+async def verifySource(segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age, lineNum, errorFile):
+    values = (segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age)
+    source = '%s,%s,%s,%s,%s,%s,%s,%s' % values
+    if (sourceloadlib.sourceIndexLoaded and sourceloadlib.sourceIndexKey(*values) is not None) \
+        or source in sourceloadlib.sourceDict or sourceloadlib.sourceMisses.has(source):
+        return sourceloadlib.verifySource(*(values + (lineNum, errorFile)))
+    return await run(('verifySource',) + values, sourceloadlib.verifySource, *(values + (lineNum, errorFile)))
+
+async def verifyStrain(strain, lineNum, errorFile):
+    args = (strain, lineNum, errorFile)
+    if strain not in sourceloadlib.strainDict and not sourceloadlib.strainMisses.has(strain):
+        await fetch(sourceloadlib.verifyStrain, strain, args)
+    return sourceloadlib.verifyStrain(*args)
+
+async def verifyTissue(tissue, lineNum, errorFile):
+    await loadTable('tissue', sourceloadlib.tissueDict)
+    return sourceloadlib.verifyTissue(tissue, lineNum, errorFile)
+
+async def verifySegmentType(segmentType, lineNum, errorFile):
+    await loadTable('segmentType', sourceloadlib.segmentTypeDict)
+    return sourceloadlib.verifySegmentType(segmentType, lineNum, errorFile)
+
+async def verifyVectorType(vectorType, lineNum, errorFile):
+    await loadTable('vectorType', sourceloadlib.vectorTypeDict)
+    return sourceloadlib.verifyVectorType(vectorType, lineNum, errorFile)
+
+#
+# alleleloadlib
+#
+
+async def verifyMutnatCellLine(mutantCellLine, lineNum, errorFile):
+    args = (mutantCellLine, lineNum, errorFile)
+    if mutantCellLine in alleleloadlib.mutantCellLineDict \
+        or alleleloadlib.mutantCellLineMisses.has(mutantCellLine):
+        return alleleloadlib.verifyMutnatCellLine(*args)
+    return await run(('verifyMutnatCellLine', mutantCellLine), alleleloadlib.verifyMutnatCellLine, *args)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+# Program: agecheck.py
+#
+# Purpose:
+#
+#	Check agelib.ageMinMax against the conformance corpus agecorpus.txt.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	agecheck.py [corpus]
+#
+# Envvars:
+#
+# Inputs:
+#
+#	agecorpus.txt (tab-delimited)
+#
+#	field 1: age string, with unicode_escape escapes (\t, \n, \uXXXX)
+#	field 2: expected ageMin, as repr() of the float
+#	field 3: expected ageMax, as repr() of the float
+#
+#	The expected values were produced by the re/locale.atof
+#	implementation of ageMinMax that preceded the memoized parser.
+#
+# Outputs:
+#
+#	one line per mismatch, and a summary line
+#
+# Exit Codes:
+#
+#	0 = every age matches, 1 = at least one mismatch
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#	Every age is checked twice, so both the parsed and the memoized
+#	result are compared.
+#
+
+import sys
+import os
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchDir))
+
+import agelib
+
+def main():
+
+    if len(sys.argv) > 1:
+        corpus = sys.argv[1]
+    else:
+        corpus = os.path.join(benchDir, 'agecorpus.txt')
+
+    checked = 0
+    failed = 0
+
+    with open(corpus, encoding = 'ascii') as fp:
+        for line in fp:
+            tokens = str.split(line.rstrip('\n'), '\t')
+            age = tokens[0].encode('ascii').decode('unicode_escape')
+            expected = (tokens[1], tokens[2])
+
+            for i in range(2):
+                ageMin, ageMax = agelib.ageMinMax(age)
+                actual = (repr(ageMin), repr(ageMax))
+                checked = checked + 1
+                if actual != expected:
+                    failed = failed + 1
+                    print('MISMATCH %r: expected %s, got %s' % (age, expected, actual))
+
+    print('%d checked, %d mismatches' % (checked, failed))
+
+    if failed > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
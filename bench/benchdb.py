@@ -0,0 +1,208 @@
+#
+# Program: benchdb.py
+#
+# Purpose:
+#
+#	In-process stand-in for the MGI db module, used by benchmark.py.
+#	Holds a synthetic copy of the MGD tables used by the data load
+#	libraries in an in-memory SQLite database.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	import benchdb
+#	benchdb.seed(markers = 50000)
+#	sys.modules['db'] = benchdb
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+# Exit Codes:
+#
+# Assumes:
+#
+#	the queries issued by the libraries are valid SQLite
+#
+# Bugs:
+#
+#	SQLite answers in microseconds; use setLatency() to add a simulated
+#	round-trip time to every call.
+#
+# Implementation:
+#
+#	Accession IDs of every object type live in ACC_Accession; the
+#	*_Acc_View views select one MGI type, as in MGD.
+#
+#	Synthetic data, for n = markers:
+#
+#	markers		MGI:10 .. MGI:10n, _Marker_key 1..n
+#			every 10th marker is human
+#	probes		MGI:10i+1, _Probe_key 1..n
+#	references	J:1 .. J:n, _Refs_key 100000+i
+#	terms		GO:0000001 .. (vocab 4), _Term_key 500000+i
+#	strains		'strain i', _Strain_key i
+#	sources		_Source_key 700000+i, 'library i' for every 3rd source,
+#			library IDs LIBi (logical DB 9 odd, 2 even)
+#	cell lines	'ES i' (ALL_CellLine, mutant)
+#
+
+import sys
+import time
+import sqlite3
+
+#globals
+
+connection = sqlite3.connect(':memory:', check_same_thread = False)
+connection.row_factory = sqlite3.Row
+
+sqlCount = 0		# number of sql() calls
+latency = 0.0		# seconds added to every sql() call
+
+SCHEMA = '''
+create table ACC_LogicalDB (_LogicalDB_key int, name text, modification_date text);
+create table ACC_MGIType (_MGIType_key int, name text, dbView text, modification_date text);
+create table MRK_Types (_Marker_Type_key int, name text, modification_date text);
+create table MGI_Organism (_Organism_key int, commonName text, modification_date text);
+create table MGI_User (_User_key int, login text, modification_date text);
+create table MRK_Marker (_Marker_key int, _Organism_key int, _Marker_Type_key int, symbol text, modification_date text);
+create index MRK_Marker_idx_key on MRK_Marker (_Marker_key);
+create table PRB_Probe (_Probe_key int, name text, modification_date text);
+create table BIB_Refs (_Refs_key int, title text, modification_date text);
+create table ACC_Accession (_Accession_key integer primary key, accID text, prefixPart text,
+    numericPart int, _LogicalDB_key int, _Object_key int, _MGIType_key int, preferred int,
+    modification_date text);
+create index ACC_Accession_idx_accID on ACC_Accession (accID);
+create index ACC_Accession_idx_object on ACC_Accession (_Object_key, _MGIType_key);
+create view MRK_Acc_View as select * from ACC_Accession where _MGIType_key = 2;
+create view PRB_Acc_View as select * from ACC_Accession where _MGIType_key = 3;
+create view PRB_Source_Acc_View as select * from ACC_Accession where _MGIType_key = 5;
+create view VOC_Term_Acc_View as select * from ACC_Accession where _MGIType_key = 13;
+create view MRK_Marker_View as select _Marker_key as _Object_key, symbol as description from MRK_Marker;
+create view PRB_Probe_View as select _Probe_key as _Object_key, name as description from PRB_Probe;
+create table VOC_Term (_Term_key int, _Vocab_key int, term text, modification_date text);
+create index VOC_Term_idx_term on VOC_Term (term);
+create index VOC_Term_idx_vocab on VOC_Term (_Vocab_key);
+create table PRB_Tissue (_Tissue_key int, tissue text, modification_date text);
+create table PRB_Strain (_Strain_key int, strain text, modification_date text);
+create index PRB_Strain_idx_strain on PRB_Strain (strain);
+create table PRB_Source (_Source_key int, _SegmentType_key int, _Vector_key int,
+    _Organism_key int, _Strain_key int, _Tissue_key int, _Gender_key int,
+    _CellLine_key int, name text, age text, isCuratorEdited int, modification_date text);
+create index PRB_Source_idx_strain on PRB_Source (_Strain_key);
+create index PRB_Source_idx_name on PRB_Source (name);
+create table ALL_CellLine (_CellLine_key int, cellLine text, isMutant int, modification_date text);
+create index ALL_CellLine_idx_cellLine on ALL_CellLine (cellLine);
+'''
+
+DATE = '2024-01-01 00:00:00'
+
+AGES = ['Not Specified', 'embryonic', 'postnatal', 'postnatal adult',
+    'embryonic day 14.5', 'embryonic day 10.5,12.5', 'postnatal day 7',
+    'postnatal week 8', 'postnatal month 2-3', 'embryonic day 9.5-10.5']
+
+# Purpose:  runs SQL against the stand-in database
+# Returns:  list of dictionaries (one per row), or a list of such lists
+#	if cmds is a list, as db.sql does
+# Assumes:  nothing
+# Effects:  counts the call; sleeps for the simulated latency
+# Throws:  sqlite3.Error
+
+def sql(cmds, parser = 'auto', **kwargs):
+
+    global sqlCount
+
+    if isinstance(cmds, list):
+        return [sql(x, parser) for x in cmds]
+
+    sqlCount = sqlCount + 1
+
+    if latency > 0:
+        time.sleep(latency)
+
+    cursor = connection.execute(cmds)
+    return [dict(r) for r in cursor.fetchall()]
+
+def useOneConnection(value = 0):
+    pass
+
+def setTrace(value = 0):
+    pass
+
+# Purpose:  sets the simulated round-trip time
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def setLatency(
+    seconds	# seconds per sql() call (float)
+    ):
+
+    global latency
+
+    latency = seconds
+
+# Purpose:  loads the synthetic data
+# Returns:  nothing
+# Assumes:  called once
+# Effects:  creates and fills the stand-in tables
+# Throws:  nothing
+
+def seed(
+    markers = 50000	# number of markers; the other tables scale with it (integer)
+    ):
+
+    c = connection
+    n = markers
+
+    c.executescript(SCHEMA)
+
+    c.executemany('insert into ACC_LogicalDB values (?,?,?)',
+        [(1, 'MGI', DATE), (2, 'GenBank', DATE), (9, 'Sequence DB', DATE), (31, 'GO', DATE)])
+    c.executemany('insert into ACC_MGIType values (?,?,?,?)',
+        [(1, 'Reference', 'BIB_View', DATE), (2, 'Marker', 'MRK_Marker_View', DATE),
+         (3, 'Segment', 'PRB_Probe_View', DATE), (5, 'Source', 'PRB_Source_View', DATE),
+         (13, 'Vocabulary Term', 'VOC_Term_View', DATE)])
+    c.executemany('insert into MRK_Types values (?,?,?)',
+        [(1, 'Gene', DATE), (2, 'DNA Segment', DATE), (3, 'Cytogenetic Marker', DATE)])
+    c.executemany('insert into MGI_Organism values (?,?,?)',
+        [(1, 'mouse, laboratory', DATE), (2, 'human', DATE), (40, 'rat', DATE)])
+    c.executemany('insert into MGI_User values (?,?,?)',
+        [(1100 + i, 'user%d' % (i), DATE) for i in range(100)] + [(1001, 'dbo', DATE)])
+    c.executemany('insert into MRK_Marker values (?,?,?,?,?)',
+        [(i, 1 if i % 10 else 2, 1, 'Gene%d' % (i), DATE) for i in range(1, n + 1)])
+    c.executemany('insert into PRB_Probe values (?,?,?)',
+        [(i, 'probe %d' % (i), DATE) for i in range(1, n + 1)])
+
+    acc = []
+    for i in range(1, n + 1):
+        acc.append(('MGI:%d' % (i * 10), 'MGI:', i * 10, 1, i, 2, 1, DATE))
+        acc.append(('MGI:%d' % (i * 10 + 1), 'MGI:', i * 10 + 1, 1, i, 3, 1, DATE))
+        acc.append(('J:%d' % (i), 'J:', i, 1, 100000 + i, 1, 1, DATE))
+        acc.append(('GO:%07d' % (i), 'GO:', i, 31, 500000 + i, 13, 1, DATE))
+        acc.append(('LIB%d' % (i), 'LIB', i, 9 if i % 2 else 2, 700000 + i, 5, 1, DATE))
+    c.executemany('insert into ACC_Accession (accID, prefixPart, numericPart, _LogicalDB_key, ' + \
+        '_Object_key, _MGIType_key, preferred, modification_date) values (?,?,?,?,?,?,?,?)', acc)
+
+    terms = [(500000 + i, 4, 'term %d' % (i), DATE) for i in range(1, n + 1)]
+    terms = terms + [(100, 10, 'cDNA', DATE), (101, 10, 'genomic', DATE), (102, 10, 'Not Specified', DATE),
+        (110, 17, 'Female', DATE), (111, 17, 'Male', DATE), (112, 17, 'Pooled', DATE), (113, 17, 'Not Specified', DATE),
+        (120, 18, 'Not Specified', DATE), (121, 18, 'HeLa', DATE),
+        (130, 24, 'Plasmid', DATE), (131, 24, 'Phage', DATE), (132, 24, 'Not Specified', DATE)]
+    c.executemany('insert into VOC_Term values (?,?,?,?)', terms)
+
+    c.executemany('insert into PRB_Tissue values (?,?,?)',
+        [(-1, 'Not Specified', DATE)] + [(i, 'tissue %d' % (i), DATE) for i in range(1, 1001)])
+    c.executemany('insert into PRB_Strain values (?,?,?)',
+        [(i, 'strain %d' % (i), DATE) for i in range(1, n + 1)])
+    c.executemany('insert into PRB_Source values (?,?,?,?,?,?,?,?,?,?,?,?)',
+        [(700000 + i, 100, 130, 1, i, i % 1000 + 1, 110 + i % 4, 120, 'library %d' % (i) if i % 3 == 0 else None,
+          AGES[i % len(AGES)], 1 if i % 50 == 0 else 0, DATE) for i in range(1, n + 1)])
+    c.executemany('insert into ALL_CellLine values (?,?,?,?)',
+        [(i, 'ES %d' % (i), 1, DATE) for i in range(1, n + 1)])
+
+    c.commit()
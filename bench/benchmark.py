@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+#
+# Program: benchmark.py
+#
+# Purpose:
+#
+#	Measure throughput and memory of the verify* functions of loadlib,
+#	sourceloadlib and alleleloadlib, and of agelib.ageMinMax, without
+#	a live MGD database.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	benchmark.py [-r rows] [-m missRate] [-d distinct] [-n markers]
+#		[-l latency] [-M] [scenario ...]
+#
+#	-r rows		input rows per scenario (default 100000)
+#	-m missRate	fraction of distinct values that are invalid (default 0.05)
+#	-d distinct	number of distinct input values (default 10000)
+#	-n markers	size of the synthetic database (default 50000)
+#	-l latency	simulated database round trip, in milliseconds (default 0)
+#	-M		also measure peak memory (tracemalloc; separate run)
+#	scenario	verifier names (default: all); -h lists them
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+#	one line per scenario: seconds, rows/second, db.sql calls, peak memory
+#
+# Exit Codes:
+#
+#	0 = success, 1 = usage error
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#	Each scenario runs in its own child process, so every run starts
+#	with empty caches.  The child seeds benchdb (SQLite) and installs it
+#	as the db module before importing the libraries; mgi_utils and
+#	accessionlib are replaced by minimal stand-ins if they are not installed.
+#	Inputs are drawn with a fixed random seed, so runs are repeatable.
+#
+
+import sys
+import os
+import time
+import types
+import random
+import getopt
+import subprocess
+import tracemalloc
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+libDir = os.path.dirname(benchDir)
+
+#globals
+
+errorFile = None	# /dev/null; errors are written as in a real load
+
+# Purpose:  installs the stand-in db (and, if missing, mgi_utils and accessionlib)
+# Returns:  the benchdb module
+# Assumes:  the libraries have not been imported yet
+# Effects:  seeds the stand-in database; changes sys.modules and sys.path
+# Throws:  nothing
+
+def installStandIns(
+    markers,	# size of the synthetic database (integer)
+    latency	# simulated round trip in seconds (float)
+    ):
+
+    sys.path.insert(0, libDir)
+    sys.path.insert(0, benchDir)
+
+    import benchdb
+
+    benchdb.seed(markers)
+    benchdb.setLatency(latency)
+    sys.modules['db'] = benchdb
+
+    try:
+        import mgi_utils
+    except ImportError:
+        mgi_utils = types.ModuleType('mgi_utils')
+        mgi_utils.date = lambda format = '%c': time.strftime(format)
+        sys.modules['mgi_utils'] = mgi_utils
+
+    try:
+        import accessionlib
+    except ImportError:
+        accessionlib = types.ModuleType('accessionlib')
+        def get_Object_key(accID, mgiType = None):
+            results = benchdb.sql('select _Object_key from ACC_Accession ' + \
+                'where accID = \'%s\' and _MGIType_key = 1' % (accID))
+            if len(results) == 1:
+                return results[0]['_Object_key']
+            return None
+        accessionlib.get_Object_key = get_Object_key
+        sys.modules['accessionlib'] = accessionlib
+
+    return benchdb
+
+#
+# scenarios
+#
+# name : (module, valid value, invalid value, call[, setup])
+#	valid(rng, n) returns a valid input value drawn from the synthetic data
+#	invalid(i) returns the i-th invalid input value
+#	call(module, value, lineNum) runs the verifier on one input value
+#	setup(module, values), if given, runs inside the timed section before
+#	the first call (e.g. a preload)
+#
+
+def mouseMarker(rng, n):
+    i = rng.randrange(1, n + 1)
+    if i % 10 == 0:
+        i = i - 1
+    return i
+
+def source(rng, n):
+    import benchdb
+    i = rng.randrange(1, n + 1)
+    if i % 50 == 0:
+        i = i - 1
+    return (100, 130, 1, i, i % 1000 + 1, 110 + i % 4, 120, benchdb.AGES[i % len(benchdb.AGES)])
+
+def row(rng, n):
+    return ('MGI:%d' % (10 * mouseMarker(rng, n)), 'GO:%07d' % (rng.randrange(1, n + 1)),
+        'J:%d' % (rng.randrange(1, n + 1)), 'user%d' % (rng.randrange(100)))
+
+def verifyRow(m, v, i, workers):
+    m.setDeferred(1)
+    keys = [m.verifyMarker(v[0], i, errorFile), m.verifyTerm(v[1], '', '', i, errorFile),
+        m.verifyReference(v[2], i, errorFile), m.verifyUser(v[3], i, errorFile)]
+    m.setDeferred(0)
+    m.resolveDeferred(workers)
+    return m.resolveRow(keys)
+
+def age(rng, n):
+    stem = rng.choice(['embryonic day', 'postnatal day', 'postnatal week', 'postnatal month'])
+    x = rng.randrange(0, 40) / 2.0
+    form = rng.randrange(3)
+    if form == 0:
+        return '%s %s' % (stem, x)
+    if form == 1:
+        return '%s %s-%s' % (stem, x, x + 1)
+    return '%s %s,%s' % (stem, x, x + 2)
+
+scenarios = {
+    'verifyLogicalDB' : ('loadlib',
+        lambda rng, n: rng.choice(['MGI', 'GenBank', 'Sequence DB']),
+        lambda i: 'no logical DB %d' % (i),
+        lambda m, v, i: m.verifyLogicalDB(v, i, errorFile)),
+    'verifyMarker' : ('loadlib',
+        lambda rng, n: 'MGI:%d' % (10 * mouseMarker(rng, n)),
+        lambda i: 'MGI:X%d' % (i),
+        lambda m, v, i: m.verifyMarker(v, i, errorFile)),
+    'verifyMarker.preload' : ('loadlib',
+        lambda rng, n: 'MGI:%d' % (10 * mouseMarker(rng, n)),
+        lambda i: 'MGI:X%d' % (i),
+        lambda m, v, i: m.verifyMarker(v, i, errorFile),
+        lambda m, values: m.preloadMarkers()),
+    'verifyMGIType' : ('loadlib',
+        lambda rng, n: rng.choice(['Marker', 'Segment', 'Reference']),
+        lambda i: 'no type %d' % (i),
+        lambda m, v, i: m.verifyMGIType(v, i, errorFile)),
+    'verifyObject' : ('loadlib',
+        lambda rng, n: 'MGI:%d' % (10 * mouseMarker(rng, n)),
+        lambda i: 'MGI:X%d' % (i),
+        lambda m, v, i: m.verifyObject(v, 2, '', i, errorFile)),
+    'verifyObject.description' : ('loadlib',
+        lambda rng, n: 'Gene%d' % (rng.randrange(1, n + 1)),
+        lambda i: 'no gene %d' % (i),
+        lambda m, v, i: m.verifyObject('', 2, v, i, errorFile)),
+    'verifyObject.preload' : ('loadlib',
+        lambda rng, n: 'Gene%d' % (rng.randrange(1, n + 1)),
+        lambda i: 'no gene %d' % (i),
+        lambda m, v, i: m.verifyObject('', 2, v, i, errorFile),
+        lambda m, values: m.preloadObjects(2)),
+    'verifyProbe' : ('loadlib',
+        lambda rng, n: 'MGI:%d' % (10 * rng.randrange(1, n + 1) + 1),
+        lambda i: 'MGI:X%d' % (i),
+        lambda m, v, i: m.verifyProbe(v, i, errorFile)),
+    'verifyReference' : ('loadlib',
+        lambda rng, n: 'J:%d' % (rng.randrange(1, n + 1)),
+        lambda i: 'J:X%d' % (i),
+        lambda m, v, i: m.verifyReference(v, i, errorFile)),
+    'verifyTerm' : ('loadlib',
+        lambda rng, n: 'GO:%07d' % (rng.randrange(1, n + 1)),
+        lambda i: 'GO:X%d' % (i),
+        lambda m, v, i: m.verifyTerm(v, '', '', i, errorFile)),
+    'verifyTerm.preload' : ('loadlib',
+        lambda rng, n: 'GO:%07d' % (rng.randrange(1, n + 1)),
+        lambda i: 'GO:X%d' % (i),
+        lambda m, v, i: m.verifyTerm(v, 4, '', i, errorFile),
+        lambda m, values: m.preloadVocab(4)),
+    'verifyUser' : ('loadlib',
+        lambda rng, n: 'user%d' % (rng.randrange(100)),
+        lambda i: 'no user %d' % (i),
+        lambda m, v, i: m.verifyUser(v, i, errorFile)),
+    'verifyMarkerType' : ('loadlib',
+        lambda rng, n: rng.choice(['Gene', 'DNA Segment']),
+        lambda i: 'no marker type %d' % (i),
+        lambda m, v, i: m.verifyMarkerType(v, i, errorFile)),
+    'resolveRow' : ('loadlib',
+        row,
+        lambda i: ('MGI:X%d' % (i), 'GO:X%d' % (i), 'J:X%d' % (i), 'no user %d' % (i)),
+        lambda m, v, i: verifyRow(m, v, i, 1)),
+    'resolveRow.threads' : ('loadlib',
+        row,
+        lambda i: ('MGI:X%d' % (i), 'GO:X%d' % (i), 'J:X%d' % (i), 'no user %d' % (i)),
+        lambda m, v, i: verifyRow(m, v, i, 4)),
+    'verifyAge' : ('sourceloadlib',
+        age,
+        lambda i: 'bad age %d' % (i),
+        lambda m, v, i: m.verifyAge(v, i, errorFile)),
+    'verifyCellLine' : ('sourceloadlib',
+        lambda rng, n: rng.choice(['HeLa', 'Not Specified']),
+        lambda i: 'no cell line %d' % (i),
+        lambda m, v, i: m.verifyCellLine(v, i, errorFile)),
+    'verifyGender' : ('sourceloadlib',
+        lambda rng, n: rng.choice(['Female', 'Male', 'Pooled']),
+        lambda i: 'no gender %d' % (i),
+        lambda m, v, i: m.verifyGender(v, i, errorFile)),
+    'verifyLibrary' : ('sourceloadlib',
+        lambda rng, n: 'library %d' % (3 * rng.randrange(1, n // 3 + 1)),
+        lambda i: 'no library %d' % (i),
+        lambda m, v, i: m.verifyLibrary(v, i, errorFile)),
+    'verifyLibrary.declared' : ('sourceloadlib',
+        lambda rng, n: 'library %d' % (3 * rng.randrange(1, n // 3 + 1)),
+        lambda i: 'no library %d' % (i),
+        lambda m, v, i: m.verifyLibrary(v, i, errorFile),
+        lambda m, values: m.declareLibraries(values)),
+    'verifyLibraryID' : ('sourceloadlib',
+        lambda rng, n: rng.randrange(1, n + 1),
+        lambda i: -i,
+        lambda m, v, i: m.verifyLibraryID('LIB%d' % (abs(v)) if v > 0 else 'NOLIB%d' % (-v),
+            9 if v % 2 else 2, i, errorFile)),
+    'verifyOrganism' : ('sourceloadlib',
+        lambda rng, n: rng.choice(['mouse, laboratory', 'human', 'rat']),
+        lambda i: 'no organism %d' % (i),
+        lambda m, v, i: m.verifyOrganism(v, i, errorFile)),
+    'verifySegmentType' : ('sourceloadlib',
+        lambda rng, n: rng.choice(['cDNA', 'genomic']),
+        lambda i: 'no segment type %d' % (i),
+        lambda m, v, i: m.verifySegmentType(v, i, errorFile)),
+    'verifySource' : ('sourceloadlib',
+        source,
+        lambda i: (100, 130, 1, -i, 1, 110, 120, 'Not Specified'),
+        lambda m, v, i: m.verifySource(*(v + (i, errorFile)))),
+    'verifySource.preload' : ('sourceloadlib',
+        source,
+        lambda i: (100, 130, 1, -i, 1, 110, 120, 'Not Specified'),
+        lambda m, v, i: m.verifySource(*(v + (i, errorFile))),
+        lambda m, values: m.preloadSources()),
+    'verifyStrain' : ('sourceloadlib',
+        lambda rng, n: 'strain %d' % (rng.randrange(1, n + 1)),
+        lambda i: 'no strain %d' % (i),
+        lambda m, v, i: m.verifyStrain(v, i, errorFile)),
+    'verifyTissue' : ('sourceloadlib',
+        lambda rng, n: 'tissue %d' % (rng.randrange(1, 1001)),
+        lambda i: 'no tissue %d' % (i),
+        lambda m, v, i: m.verifyTissue(v, i, errorFile)),
+    'verifyVectorType' : ('sourceloadlib',
+        lambda rng, n: rng.choice(['Plasmid', 'Phage']),
+        lambda i: 'no vector type %d' % (i),
+        lambda m, v, i: m.verifyVectorType(v, i, errorFile)),
+    'verifyMutnatCellLine' : ('alleleloadlib',
+        lambda rng, n: 'ES %d' % (rng.randrange(1, n + 1)),
+        lambda i: 'no cell line %d' % (i),
+        lambda m, v, i: m.verifyMutnatCellLine(v, i, errorFile)),
+    'ageMinMax' : ('agelib',
+        age,
+        lambda i: 'bad age %d' % (i),
+        lambda m, v, i: m.ageMinMax(v)),
+}
+
+# Purpose:  draws the input values of a scenario
+# Returns:  list of input values
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def inputValues(
+    scenario,	# scenario name (str.
+    rows,	# number of input rows (integer)
+    missRate,	# fraction of distinct values that are invalid (float)
+    distinct,	# number of distinct values (integer)
+    markers	# size of the synthetic database (integer)
+    ):
+
+    valid = scenarios[scenario][1]
+    invalid = scenarios[scenario][2]
+    rng = random.Random(20240101)
+
+    pool = []
+    for i in range(distinct):
+        if rng.random() < missRate:
+            pool.append(invalid(i + 1))
+        else:
+            pool.append(valid(rng, markers))
+
+    return [pool[rng.randrange(len(pool))] for i in range(rows)]
+
+# Purpose:  runs one scenario in this process
+# Returns:  nothing
+# Assumes:  called in a fresh child process
+# Effects:  prints "seconds sqlCalls peakBytes"
+# Throws:  nothing
+
+def runChild(
+    scenario, rows, missRate, distinct, markers, latency, memory
+    ):
+
+    global errorFile
+
+    benchdb = installStandIns(markers, latency)
+    errorFile = open(os.devnull, 'w')
+
+    module = scenarios[scenario][0]
+    call = scenarios[scenario][3]
+    m = __import__(module)
+    values = inputValues(scenario, rows, missRate, distinct, markers)
+
+    if memory:
+        tracemalloc.start()
+
+    sqlCount = benchdb.sqlCount
+    start = time.perf_counter()
+
+    if len(scenarios[scenario]) > 4:
+        scenarios[scenario][4](m, values)
+
+    lineNum = 0
+    for v in values:
+        lineNum = lineNum + 1
+        call(m, v, lineNum)
+
+    seconds = time.perf_counter() - start
+    peak = 0
+
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print('%f %d %d' % (seconds, benchdb.sqlCount - sqlCount, peak))
+
+# Purpose:  runs one scenario in a child process
+# Returns:  tuple (seconds, sqlCalls, peakBytes)
+# Assumes:  nothing
+# Effects:  starts a child process
+# Throws:  subprocess.CalledProcessError
+
+def runScenario(
+    scenario, rows, missRate, distinct, markers, latency, memory
+    ):
+
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child',
+        scenario, str(rows), str(missRate), str(distinct), str(markers), str(latency), str(memory)])
+    seconds, sqlCalls, peak = str.split(output.decode().strip().split('\n')[-1])
+
+    return float(seconds), int(sqlCalls), int(peak)
+
+def usage():
+    sys.stderr.write('usage: benchmark.py [-r rows] [-m missRate] [-d distinct] ' + \
+        '[-n markers] [-l latency] [-M] [scenario ...]\n')
+    sys.stderr.write('scenarios: %s\n' % (' '.join(sorted(scenarios))))
+    sys.exit(1)
+
+def main():
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        a = sys.argv[2:]
+        runChild(a[0], int(a[1]), float(a[2]), int(a[3]), int(a[4]), float(a[5]), int(a[6]))
+        return
+
+    rows = 100000
+    missRate = 0.05
+    distinct = 10000
+    markers = 50000
+    latency = 0.0
+    memory = 0
+
+    try:
+        optlist, args = getopt.getopt(sys.argv[1:], 'r:m:d:n:l:Mh')
+    except getopt.GetoptError:
+        usage()
+
+    for opt, arg in optlist:
+        if opt == '-r':
+            rows = int(arg)
+        elif opt == '-m':
+            missRate = float(arg)
+        elif opt == '-d':
+            distinct = int(arg)
+        elif opt == '-n':
+            markers = int(arg)
+        elif opt == '-l':
+            latency = float(arg) / 1000.0
+        elif opt == '-M':
+            memory = 1
+        else:
+            usage()
+
+    for scenario in args:
+        if scenario not in scenarios:
+            usage()
+
+    if len(args) == 0:
+        args = sorted(scenarios)
+
+    print('rows %d, miss rate %.2f, distinct %d, markers %d, latency %.1f ms' \
+        % (rows, missRate, distinct, markers, latency * 1000))
+    print('%-22s %10s %12s %10s %10s' % ('scenario', 'seconds', 'rows/sec', 'sql', 'peak KB'))
+
+    for scenario in args:
+        seconds, sqlCalls, peak = runScenario(scenario, rows, missRate, distinct, markers, latency, 0)
+        if memory:
+            peak = runScenario(scenario, rows, missRate, distinct, markers, latency, 1)[2]
+            peakKB = '%10d' % (peak // 1024)
+        else:
+            peakKB = '%10s' % ('-')
+        if seconds > 0:
+            rate = rows / seconds
+        else:
+            rate = 0
+        print('%-22s %10.3f %12.0f %10d %s' % (scenario, seconds, rate, sqlCalls, peakKB))
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
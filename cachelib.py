@@ -0,0 +1,280 @@
+#
+# Program: cachelib.py
+#
+# Purpose:
+#
+#	Provide the per-ID lookup caches used by the data load libraries
+#	(loadlib, sourceloadlib, alleleloadlib).
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	markerDict = cachelib.cache(__name__, 'markerDict')
+#
+#	The cache is used exactly like a dictionary.
+#	cachelib.setMaxSize(n) bounds every registered cache to n entries.
+#
+#	markerMisses = cachelib.missCache('Marker')
+#
+#	records IDs that were not found, so a repeated invalid ID costs no
+#	database round trip; cachelib.writeMissSummary(fp) reports them.
+#
+# Envvars:
+#
+#	DATALOAD_CACHESIZE	maximum number of entries per cache
+#				(optional; 0 or unset = unbounded)
+#	DATALOAD_MISSTTL	seconds an invalid ID stays in a miss cache
+#				(optional; 0 or unset = for the whole load)
+#
+# Inputs:
+#
+# Outputs:
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#	An unbounded cache is a plain dictionary, so the hit path is exactly
+#	that of the original module-level dictionaries.
+#	A bounded cache is an LRUCache: an OrderedDict that moves an entry to
+#	the end when it is read or written and evicts the least recently used
+#	entry when it is full.
+#
+#	Both classes hold a lock, so a cache may be shared by several threads;
+#	an unbounded cache is a dictionary, whose single operations are
+#	already atomic.  A membership test ("key in cache") counts as a use,
+#	so an entry just found cannot be the next one evicted.
+#
+#	A MissCache maps each invalid ID to its expiry time and counts
+#	distinct misses and repeated misses answered from the cache.
+#	Its store of IDs is itself a cache, bounded like the others.
+#
+
+import sys
+import os
+import collections
+import threading
+import time
+
+#globals
+
+maxCacheSize = int(os.environ.get('DATALOAD_CACHESIZE', '0'))
+
+missTTL = float(os.environ.get('DATALOAD_MISSTTL', '0'))
+
+caches = []		# (module name, global name) of every registered cache
+missCaches = []		# every MissCache, in creation order
+
+# Purpose:  a dictionary bounded to maxSize entries, with LRU eviction
+
+class LRUCache(collections.OrderedDict):
+
+    def __init__(self, maxSize):
+        collections.OrderedDict.__init__(self)
+        self.maxSize = maxSize
+        self.lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self.lock:
+            if collections.OrderedDict.__contains__(self, key):
+                self.move_to_end(key)
+                return True
+            return False
+
+    def __getitem__(self, key):
+        with self.lock:
+            value = collections.OrderedDict.__getitem__(self, key)
+            self.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            collections.OrderedDict.__setitem__(self, key, value)
+            self.move_to_end(key)
+            if len(self) > self.maxSize:
+                self.popitem(last = False)
+
+    def get(self, key, default = None):
+        with self.lock:
+            if key in self:
+                return self[key]
+            return default
+
+# Purpose:  creates a cache of at most maxSize entries
+# Returns:  dictionary (maxSize = 0) or LRUCache
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def newCache(
+    maxSize	# maximum number of entries; 0 = unbounded (integer)
+    ):
+
+    if maxSize > 0:
+        return LRUCache(maxSize)
+
+    return {}
+
+# Purpose:  creates and registers a module-level cache
+# Returns:  dictionary or LRUCache (see newCache)
+# Assumes:  the caller assigns the result to the global 'attr' of 'module'
+# Effects:  records the cache so that setMaxSize can replace it
+# Throws:  nothing
+
+def cache(
+    module,	# name of the module that owns the cache (str.
+    attr	# name of the cache in that module (str.
+    ):
+
+    caches.append((module, attr))
+    return newCache(maxCacheSize)
+
+# Purpose:  copies a cache into a new cache of at most maxSize entries
+# Returns:  dictionary or LRUCache (see newCache)
+# Assumes:  nothing
+# Effects:  nothing; keeps the most recently used entries
+# Throws:  nothing
+
+def resize(
+    old,	# the cache (dictionary or LRUCache)
+    maxSize	# maximum number of entries; 0 = unbounded (integer)
+    ):
+
+    new = newCache(maxSize)
+    items = list(old.items())
+    if maxSize > 0:
+        items = items[-maxSize:]
+    for key, value in items:
+        new[key] = value
+
+    return new
+
+# Purpose:  changes the bound of every registered cache
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  replaces each registered cache, and the store of each
+#	miss cache, by a new cache of at most maxSize entries,
+#	keeping its most recently used entries
+# Throws:  nothing
+
+def setMaxSize(
+    maxSize	# maximum number of entries; 0 = unbounded (integer)
+    ):
+
+    global maxCacheSize
+
+    maxCacheSize = maxSize
+
+    for module, attr in caches:
+        setattr(sys.modules[module], attr, resize(getattr(sys.modules[module], attr), maxSize))
+
+    for m in missCaches:
+        with m.lock:
+            m.misses = resize(m.misses, maxSize)
+
+# Purpose:  a negative cache of IDs that were not found in the database
+#	"key in cache" is true while the key has not expired,
+#	and counts as a repeated miss; has() does not count
+
+class MissCache:
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.misses = newCache(maxCacheSize)	# key : expiry time (0 = never)
+        self.distinct = 0			# misses that went to the database
+        self.repeated = 0			# misses answered from this cache
+        self.lock = threading.RLock()
+
+    def has(self, key):
+        with self.lock:
+            if key not in self.misses:
+                return False
+            expires = self.misses[key]
+            if expires and expires < time.time():
+                del self.misses[key]
+                return False
+            return True
+
+    def __contains__(self, key):
+        with self.lock:
+            if self.has(key):
+                self.repeated = self.repeated + 1
+                return True
+            return False
+
+    def add(self, key):
+        with self.lock:
+            if self.ttl > 0:
+                self.misses[key] = time.time() + self.ttl
+            else:
+                self.misses[key] = 0
+            self.distinct = self.distinct + 1
+
+    def clear(self):
+        with self.lock:
+            self.misses.clear()
+
+# Purpose:  creates a miss cache
+# Returns:  MissCache
+# Assumes:  nothing
+# Effects:  records the miss cache for writeMissSummary
+# Throws:  nothing
+
+def missCache(
+    name,	# name used in the summary, e.g. 'Marker' (str.
+    ttl = None	# seconds an entry stays valid; None = DATALOAD_MISSTTL (float)
+    ):
+
+    if ttl is None:
+        ttl = missTTL
+
+    m = MissCache(name, ttl)
+    missCaches.append(m)
+    return m
+
+# Purpose:  empties the registered caches
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  replaces each registered cache by an empty one, so every ID
+#	is looked up again in the database; a reader holding the old cache
+#	still sees a whole one
+# Throws:  nothing
+
+def clearCaches():
+
+    for module, attr in caches:
+        setattr(sys.modules[module], attr, newCache(maxCacheSize))
+
+# Purpose:  forgets every recorded miss
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  empties every miss cache, so an ID added to the database
+#	since it was found missing is looked up again; keeps the counts
+# Throws:  nothing
+
+def clearMisses():
+
+    for m in missCaches:
+        m.clear()
+
+# Purpose:  writes the per-load summary of the miss caches
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  writes one line per miss cache that recorded a miss:
+#	distinct misses, repeated misses and total misses
+# Throws:  nothing
+
+def writeMissSummary(
+    fp		# output file (file descriptor)
+    ):
+
+    for m in missCaches:
+        if m.distinct > 0:
+            fp.write('Invalid %s: %d distinct, %d repeated, %d total\n' \
+                % (m.name, m.distinct, m.repeated, m.distinct + m.repeated))
@@ -0,0 +1,148 @@
+#
+# Program: errorlib.py
+#
+# Purpose:
+#
+#	Provide the error reporting of the verify* functions of the data
+#	load libraries (loadlib, sourceloadlib, alleleloadlib), and a
+#	buffered error sink that groups identical errors.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	The verifiers accept, as errorFile, either a plain file (each error
+#	is written to it, as before) or an ErrorSink:
+#
+#	errorFile = errorlib.ErrorSink(open('load.error', 'w'))
+#	... load ...
+#	errorFile.writeSummary(sys.stdout)
+#	errorFile.close()
+#
+#	ErrorSink(None) keeps only the counts, for a summary-only load.
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+#	the detailed error log and the summary (see ErrorSink)
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#	An error is reported as a format, a line number and the invalid
+#	value(s); its category is the start of the format, up to " (",
+#	e.g. "Invalid Marker".  The sink counts each (category, value) and
+#	keeps its first few line numbers, and collects the detailed lines
+#	in memory, writing them in blocks.  Extra detail (the SQL text of
+#	verifySource) is only formatted when the detailed log is written.
+#
+
+import sys
+import os
+import threading
+
+#globals
+
+categories = {}		# format : category
+
+# Purpose:  a buffered error sink
+
+class ErrorSink:
+
+    def __init__(self, detailFile = None, samples = 5, bufferLines = 1000):
+        self.detailFile = detailFile	# detailed log (file descriptor) or None
+        self.samples = samples		# line numbers kept per (category, value)
+        self.bufferLines = bufferLines	# detailed lines held before they are written
+        self.buffer = []
+        self.groups = {}		# category : {value : [count, sample line numbers]}
+        self.lock = threading.RLock()
+
+    def add(self, format, lineNum, values, detail = ()):
+        category = categories.get(format)
+        if category is None:
+            category = categories[format] = format.split(' (')[0].strip()
+
+        with self.lock:
+            group = self.groups.setdefault(category, {}).get(values)
+            if group is None:
+                group = self.groups[category][values] = [0, []]
+            group[0] = group[0] + 1
+            if len(group[1]) < self.samples:
+                group[1].append(lineNum)
+
+            if self.detailFile is not None:
+                if callable(detail):
+                    detail = detail()
+                self.buffer.append(format % ((lineNum,) + values + tuple(detail)))
+                if len(self.buffer) >= self.bufferLines:
+                    self.flush()
+
+    def write(self, text):
+        with self.lock:
+            if self.detailFile is not None:
+                self.buffer.append(text)
+                if len(self.buffer) >= self.bufferLines:
+                    self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.detailFile is not None and len(self.buffer) > 0:
+                self.detailFile.write(''.join(self.buffer))
+                self.buffer = []
+
+    def close(self):
+        self.flush()
+        if self.detailFile is not None:
+            self.detailFile.close()
+
+    def getSummary(self):
+        with self.lock:
+            return dict([(c, dict([(v, (g[0], list(g[1]))) for v, g in self.groups[c].items()])) \
+                for c in self.groups])
+
+    def writeSummary(self, fp):
+        for category, groups in self.getSummary().items():
+            total = sum([g[0] for g in groups.values()])
+            fp.write('%s: %d errors, %d distinct\n' % (category, total, len(groups)))
+            for values in sorted(groups, key = lambda x: -groups[x][0]):
+                count, lines = groups[values]
+                more = ''
+                if count > len(lines):
+                    more = ', ...'
+                fp.write('\t%s\t%d\t(lines %s%s)\n' \
+                    % (', '.join([str(x) for x in values]), count, ', '.join([str(x) for x in lines]), more))
+
+# Purpose:  reports an error found by a verifier
+# Returns:  nothing
+# Assumes:  format takes the line number, the values and the detail, in that order
+# Effects:  adds the error to the sink, or writes it to the file
+# Throws:  nothing
+
+def report(
+    errorFile,		# ErrorSink, error file (file descriptor) or None
+    format,		# message format, e.g. 'Invalid Marker (row %d) %s\n' (str.
+    lineNum,		# line number (integer)
+    *values,		# the invalid value(s)
+    detail = ()		# extra values written in the detailed log only (tuple),
+			# or a function that returns them
+    ):
+
+    if errorFile is None:
+        return
+
+    if isinstance(errorFile, ErrorSink):
+        errorFile.add(format, lineNum, values, detail)
+        return
+
+    if callable(detail):
+        detail = detail()
+
+    errorFile.write(format % ((lineNum,) + values + tuple(detail)))
@@ -29,22 +29,78 @@
 
 import sys
 import os
+import io
+import array
+import bisect
+import threading
+import concurrent.futures
 import mgi_utils
 import accessionlib
+import cachelib
 import db
+import errorlib
+import statementlib
+import statslib
+import tablelib
 
 #globals
 
 logicalDBDict = {}	# logical DB
 mgiTypeDict = {}	# mgi type
-markerDict = {}      	# markers
-objectDict = {}		# objects
-probeDict = {}		# probes
-referenceDict = {}      # references
-termDict = {}		# terms
+mgiTypeViewDict = {}	# mgi type key : dbView
+markerDict = cachelib.cache(__name__, 'markerDict')	# markers, by (accession ID, organism)
+objectDict = cachelib.cache(__name__, 'objectDict')	# objects, by (mgi type key, accession ID)
+objectDescriptionDict = cachelib.cache(__name__, 'objectDescriptionDict')	# objects, by (mgi type key, description)
+objectDescriptionIndex = {}	# mgi type key : dictionary of description : object key (see preloadObjects)
+probeDict = cachelib.cache(__name__, 'probeDict')	# probes
+referenceDict = cachelib.cache(__name__, 'referenceDict')	# references
+termDict = cachelib.cache(__name__, 'termDict')	# terms
+termIDIndex = {}	# Term Accession ID : Term key, for the preloaded vocabularies
+termNameIndex = {}	# Vocabulary key : dictionary of Term : Term key (see preloadVocab)
 userDict = {}		# users
 markerTypeDict = {}	# marker types
 
+markerMisses = cachelib.missCache('Marker')	# invalid markers
+probeMisses = cachelib.missCache('Probe')	# invalid probes
+
+markerVerified = set()	# markers already returned by verifyMarker (for checkDuplicate); never bounded
+markerIndex = {}	# organism : (numeric parts, marker keys), see preloadMarkers
+indexVersions = {}	# (index, organism or key) : signature of the rows of a preloaded index (see refreshIndexes)
+
+prefetchChunkSize = 500	# number of accession IDs per set-based prefetch query
+
+batchResolvers = {}	# verify* function name : function that prefetches a list of DeferredKeys
+
+resolvePools = {}	# number of threads : thread pool used by resolveDeferred (see resolverPool)
+resolvePoolLock = threading.Lock()
+
+keyAllocators = {}	# table name : KeyAllocator (see nextKey)
+keyAllocatorsLock = threading.Lock()
+
+tablelib.register('logicalDB', __name__, 'logicalDBDict', 'ACC_LogicalDB', 'name', '_LogicalDB_key')
+tablelib.register('mgiType', __name__, 'mgiTypeDict', 'ACC_MGIType', 'name', '_MGIType_key')
+tablelib.register('mgiTypeView', __name__, 'mgiTypeViewDict', 'ACC_MGIType', '_MGIType_key', 'dbView')
+tablelib.register('markerType', __name__, 'markerTypeDict', 'MRK_Types', 'name', '_Marker_Type_key')
+tablelib.register('user', __name__, 'userDict', 'MGI_User', 'login', '_User_key', shared = 0)
+
+statementlib.register('verifyMarker', 'select a._Object_key ' + \
+    'from MRK_Acc_View a, MRK_Marker m, MGI_Organism o ' + \
+    'where a.accID = $1 ' + \
+    'and a._LogicalDB_key = 1 ' + \
+    'and a._Object_key = m._Marker_key ' + \
+    'and m._Organism_key = o._Organism_key ' + \
+    'and o.commonName = $2')
+statementlib.register('verifyObject', 'select a._Object_key from ACC_Accession a ' + \
+    'where a.accID = $1 ' + \
+    'and a._MGIType_key = $2')
+statementlib.register('verifyProbe', 'select _Object_key from PRB_Acc_View where accID = $1')
+statementlib.register('verifyTerm', 'select a._Object_key from VOC_Term_Acc_View a ' + \
+    'where a.accID = $1')
+statementlib.register('verifyTermDescription', 'select _Term_key from VOC_Term ' + \
+    'where term = $1 ' + \
+    'and _Vocab_key = $2')
+statementlib.register('verifyUser', 'select _User_key from MGI_User where login = $1')
+
 loaddate = mgi_utils.date('%m/%d/%Y %H:%M:%S')	# current date
 
 # Purpose: verifies the Logical DB value
@@ -62,16 +118,17 @@ def verifyLogicalDB(
 
     global logicalDBDict
 
+    if deferred.mode:
+        return deferVerify(verifyLogicalDB, logicalDB, lineNum, errorFile)
+
     if len(logicalDBDict) == 0:
-        results = db.sql('select _LogicalDB_key, name from ACC_LogicalDB', 'auto')
-        for r in results:
-            logicalDBDict[r['name']] = r['_LogicalDB_key']
+        tablelib.load('logicalDB')
 
     if logicalDB in logicalDBDict:
         logicalDBKey = logicalDBDict[logicalDB]
     else:
         if errorFile != None:
-            errorFile.write('Invalid Logical DB (row %d): %s\n' % (lineNum, logicalDB))
+            errorlib.report(errorFile, 'Invalid Logical DB (row %d): %s\n', lineNum, logicalDB)
         logicalDBKey = 0
 
     return logicalDBKey
@@ -82,6 +139,8 @@ def verifyLogicalDB(
 # Effects:  verifies that the Marker exists either in the Marker dictionary or the database
 #	writes to the error file if the Marker is invalid
 #	adds the Marker id and key to the Marker dictionary if the Marker is valid
+#	the MGI IDs of a preloaded organism (see preloadMarkers) are verified
+#	from the Marker index
 # Throws:  nothing
 
 def verifyMarker(
@@ -92,36 +151,181 @@ def verifyMarker(
     organism = 'mouse, laboratory'
     ):
 
-    global markerDict
+    global markerDict, markerVerified
+
+    if deferred.mode:
+        return deferVerify(verifyMarker, markerID, lineNum, errorFile, checkDuplicate, organism)
 
     markerKey = 0
 
-    if markerID in markerDict:
-        if checkDuplicate:
-            if errorFile != None:
-                errorFile.write('Duplicate Mouse Marker (row %d) %s\n' % (lineNum, markerID))
-        else:
-            markerKey = markerDict[markerID]
+    if markerID in markerVerified and checkDuplicate:
+        if errorFile != None:
+            errorlib.report(errorFile, 'Duplicate Mouse Marker (row %d) %s\n', lineNum, markerID)
+    elif organism in markerIndex and markerNumber(markerID) is not None:
+        markerKey = indexedMarker(markerID, organism)
+        if markerKey > 0:
+            markerVerified.add(markerID)
+    elif (markerID, organism) in markerDict:
+        markerKey = markerDict[(markerID, organism)]
+        markerVerified.add(markerID)
+    elif (markerID, organism) in markerMisses:
+        pass
     else:
-        results = db.sql('select a._Object_key ' + \
-            'from MRK_Acc_View a, MRK_Marker m, MGI_Organism o ' + \
-            'where a.accID = \'%s\' ' % (markerID) + \
-            'and a._LogicalDB_key = 1 ' + \
-            'and a._Object_key = m._Marker_key ' + \
-            'and m._Organism_key = o._Organism_key ' + \
-            'and o.commonName = \'%s\' ' % (organism), 'auto')
+        results = statementlib.execute('verifyMarker', markerID, organism)
 
         for r in results:
             if r['_Object_key'] is None:
                 if errorFile != None:
-                    errorFile.write('Invalid Marker (row %d) %s\n' % (lineNum, markerID))
+                    errorlib.report(errorFile, 'Invalid Marker (row %d) %s\n', lineNum, markerID)
                 markerKey = 0
             else:
                 markerKey = r['_Object_key']
-                markerDict[markerID] = markerKey
+                markerDict[(markerID, organism)] = markerKey
+                markerVerified.add(markerID)
+
+        if markerKey == 0:
+            markerMisses.add((markerID, organism))
 
     return markerKey
 
+# Purpose:  returns the numeric part of an MGI Marker Accession ID
+# Returns:  integer, or None if markerID is not of the form MGI:nnnn
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def markerNumber(
+    markerID	# Accession ID of the Marker (str.
+    ):
+
+    if markerID[:4] != 'MGI:':
+        return None
+
+    digits = markerID[4:]
+
+    # 'MGI:0123' is not the ID of numeric part 123
+    if not digits.isdigit() or digits[0] == '0':
+        return None
+
+    return int(digits)
+
+# Purpose:  looks up a Marker in the Marker index
+# Returns:  the Marker key, or 0 if the Marker is not in the index
+# Assumes:  the Markers of the organism are preloaded (see preloadMarkers)
+#	and markerNumber(markerID) is not None
+# Effects:  nothing
+# Throws:  nothing
+
+def indexedMarker(
+    markerID,	# Accession ID of the Marker (str.
+    organism	# organism common name (str.
+    ):
+
+    numbers, keys = markerIndex[organism]
+    n = markerNumber(markerID)
+    i = bisect.bisect_left(numbers, n)
+
+    if i < len(numbers) and numbers[i] == n:
+        return keys[i]
+
+    return 0
+
+# Purpose:  preloads the MGI Marker Accession IDs of an organism
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  loads the MGI ID of every Marker of the organism in one query
+#	into the Marker index: two sorted integer arrays, the numeric parts
+#	of the IDs and the Marker keys, searched by bisection;
+#	verifyMarker then verifies any MGI:nnnn ID of this organism from
+#	memory, at 16 bytes per Marker;
+#	with reload = 1, builds the index again and swaps it in
+# Throws:  nothing
+
+def preloadMarkers(
+    organism = 'mouse, laboratory',	# organism common name (str.
+    reload = 0		# 1 = load the index even if it is loaded (integer)
+    ):
+
+    global markerIndex
+
+    if organism in markerIndex and not reload:
+        return
+
+    version = indexSignature('select count(*) as rowCount, max(a.modification_date) as maxDate ' + \
+        markerIndexRows(organism))
+
+    rows = {}
+
+    results = db.sql('select a.numericPart, a._Object_key ' + markerIndexRows(organism), 'auto')
+
+    for r in results:
+        if r['numericPart'] is not None:
+            rows.setdefault(int(r['numericPart']), r['_Object_key'])
+
+    numbers = array.array('q', sorted(rows))
+    keys = array.array('q', [rows[x] for x in numbers])
+
+    markerIndex[organism] = (numbers, keys)
+    indexVersions[('marker', organism)] = version
+
+# Purpose:  returns the from and where clauses of the Marker index rows
+# Returns:  str.
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def markerIndexRows(
+    organism	# organism common name (str.
+    ):
+
+    return 'from MRK_Acc_View a, MRK_Marker m, MGI_Organism o ' + \
+        'where a.prefixPart = \'MGI:\' ' + \
+        'and a._LogicalDB_key = 1 ' + \
+        'and a._Object_key = m._Marker_key ' + \
+        'and m._Organism_key = o._Organism_key ' + \
+        'and o.commonName = \'%s\' ' % (organism)
+
+# Purpose:  reads the signature of the rows of a preloaded index
+# Returns:  tuple of str. (the columns of the one row of the query)
+# Assumes:  the query returns one row of aggregates (row count, max
+#	modification date or max key)
+# Effects:  queries the database
+# Throws:  nothing
+
+def indexSignature(
+    query	# signature query (str.
+    ):
+
+    results = db.sql(query, 'auto')
+
+    return tuple([str(results[0][x]) for x in sorted(results[0])])
+
+# Purpose:  refreshes the preloaded indexes
+# Returns:  nothing
+# Assumes:  run by tablelib.refresh
+# Effects:  loads again each Marker index (preloadMarkers), Term index
+#	(preloadVocab) and Object description index (preloadObjects) whose
+#	rows have changed since it was loaded: a different row count or
+#	max modification date (for an Object description index, max
+#	Object key, as the dbViews have no modification date)
+# Throws:  nothing
+
+def refreshIndexes():
+
+    for organism in list(markerIndex):
+        if indexSignature('select count(*) as rowCount, max(a.modification_date) as maxDate ' + \
+                markerIndexRows(organism)) != indexVersions.get(('marker', organism)):
+            preloadMarkers(organism, reload = 1)
+
+    for vocabKey in list(termNameIndex):
+        if indexSignature(termIndexSignatureQuery(vocabKey)) != indexVersions.get(('vocab', vocabKey)):
+            preloadVocab(vocabKey, reload = 1)
+
+    for typeKey in list(objectDescriptionIndex):
+        query = objectIndexSignatureQuery(typeKey)
+        if query is not None and indexSignature(query) != indexVersions.get(('object', typeKey)):
+            preloadObjects(typeKey, reload = 1)
+
 # Purpose: verifies the MGI Type value
 # Returns: 0 if the MGI Type value does not exist in MGI
 #          else the primary key of the MGI Type
@@ -137,16 +341,17 @@ def verifyMGIType(
 
     global mgiTypeDict
 
+    if deferred.mode:
+        return deferVerify(verifyMGIType, mgiType, lineNum, errorFile)
+
     if len(mgiTypeDict) == 0:
-        results = db.sql('select _MGIType_key, name from ACC_MGIType', 'auto')
-        for r in results:
-            mgiTypeDict[r['name']] = r['_MGIType_key']
+        tablelib.load('mgiType')
 
     if mgiType in mgiTypeDict:
         mgiTypeKey = mgiTypeDict[mgiType]
     else:
         if errorFile != None:
-            errorFile.write('Invalid MGI Type (row %d): %s\n' % (lineNum, mgiType))
+            errorlib.report(errorFile, 'Invalid MGI Type (row %d): %s\n', lineNum, mgiType)
         mgiTypeKey = 0
 
     return mgiTypeKey
@@ -158,6 +363,8 @@ def verifyMGIType(
 #	by either the Object ID or the Object Description
 #	writes to the error file if the Object is invalid
 #	adds the Object id and key to the Object dictionary if the Object is valid
+#	both dictionaries are keyed by MGI Type; the descriptions of a
+#	preloaded MGI Type (see preloadObjects) are verified from memory
 # Throws:  nothing
 
 def verifyObject(
@@ -168,41 +375,121 @@ def verifyObject(
     errorFile   	# error file descriptor
     ):
 
-    global objectDict
+    global objectDict, objectDescriptionDict
+
+    if deferred.mode:
+        return deferVerify(verifyObject, objectID, mgiTypeKey, objectDescription, lineNum, errorFile)
 
     objectKey = None
+    typeKey = mgiTypeValue(mgiTypeKey)
 
-    if len(objectID) > 0 and objectID in objectDict:
-        return objectDict[objectID] 
+    if len(objectID) > 0 and (typeKey, objectID) in objectDict:
+        objectKey = objectDict[(typeKey, objectID)]
 
     elif len(objectID) > 0:
-        results = db.sql('select a._Object_key from ACC_Accession a ' + \
-            'where a.accID = \'%s\' ' % (objectID) + \
-            'and a._MGIType_key = %s' % (mgiTypeKey), 'auto')
+        results = statementlib.execute('verifyObject', objectID, typeKey)
 
         for r in results:
             objectKey = r['_Object_key']
+
+        objectDict[(typeKey, objectID)] = objectKey
+
+    elif typeKey in objectDescriptionIndex:
+        objectKey = objectDescriptionIndex[typeKey].get(objectDescription)
+
+    elif (typeKey, objectDescription) in objectDescriptionDict:
+        objectKey = objectDescriptionDict[(typeKey, objectDescription)]
+
     else:
-        results = db.sql('select dbView from ACC_MGIType where _MGIType_key = %s' % (mgiTypeKey), 'auto')
+        if len(mgiTypeViewDict) == 0:
+            tablelib.load('mgiTypeView')
 
-        if len(results) > 0:
-            dbView = results[0]['dbView']
+        dbView = mgiTypeViewDict.get(typeKey)
 
-            results = db.sql('select _Object_key from %s ' % (dbView) + \
-                ' where description = \'%s\' ' % (objectDescription), 'auto')
+        if dbView is not None:
+            name = 'verifyObjectDescription_%s' % (dbView)
+            if name not in statementlib.statements:
+                statementlib.register(name, 'select _Object_key from %s where description = $1' % (dbView))
+            results = statementlib.execute(name, objectDescription)
 
             for r in results:
                 objectKey = r['_Object_key']
 
-    objectDict[objectID] = objectKey
+        objectDescriptionDict[(typeKey, objectDescription)] = objectKey
 
     if objectKey is None:
         if errorFile != None:
-            errorFile.write('Invalid Object (row %d) %s\n' % (lineNum, objectID))
+            errorlib.report(errorFile, 'Invalid Object (row %d) %s\n', lineNum, objectID)
         objectKey = 0
 
     return objectKey
 
+# Purpose:  returns the MGI Type key used in the Object caches
+# Returns:  integer, or the value itself if it is not an integer
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def mgiTypeValue(
+    mgiTypeKey	# MGI Type key (str. or integer)
+    ):
+
+    try:
+        return int(mgiTypeKey)
+    except (TypeError, ValueError):
+        return mgiTypeKey
+
+# Purpose:  preloads the Object descriptions of an MGI Type
+# Returns:  nothing
+# Assumes:  the MGI Type has a dbView with _Object_key and description columns
+# Effects:  loads every description of the MGI Type's dbView in one scan;
+#	verifyObject then verifies any description of this MGI Type from memory;
+#	with reload = 1, builds the index again and swaps it in
+# Throws:  nothing
+
+def preloadObjects(
+    mgiTypeKey,	# MGI Type key (str. or integer)
+    reload = 0	# 1 = load the index even if it is loaded (integer)
+    ):
+
+    global objectDescriptionIndex
+
+    typeKey = mgiTypeValue(mgiTypeKey)
+
+    if typeKey in objectDescriptionIndex and not reload:
+        return
+
+    descriptions = {}
+    query = objectIndexSignatureQuery(typeKey)
+
+    if query is not None:
+        indexVersions[('object', typeKey)] = indexSignature(query)
+        results = db.sql('select _Object_key, description from %s' % (mgiTypeViewDict[typeKey]), 'auto')
+        for r in results:
+            descriptions[r['description']] = r['_Object_key']
+
+    objectDescriptionIndex[typeKey] = descriptions
+
+# Purpose:  builds the signature query of the Object description index
+#	of an MGI Type
+# Returns:  str., or None if the MGI Type has no dbView
+# Assumes:  nothing
+# Effects:  loads the MGI Type dbViews if they are not loaded
+# Throws:  nothing
+
+def objectIndexSignatureQuery(
+    typeKey	# MGI Type key (integer or str.)
+    ):
+
+    if len(mgiTypeViewDict) == 0:
+        tablelib.load('mgiTypeView')
+
+    if mgiTypeViewDict.get(typeKey) is None:
+        return None
+
+    return 'select count(*) as rowCount, cast(max(_Object_key) as text) as maxKey ' + \
+        'from %s' % (mgiTypeViewDict[typeKey])
+
 # Purpose:  verify Probe Accession ID
 # Returns:  Probe Key if Probe is valid, else 0
 # Assumes:  nothing
@@ -219,22 +506,30 @@ def verifyProbe(
 
     global probeDict
 
+    if deferred.mode:
+        return deferVerify(verifyProbe, probeID, lineNum, errorFile)
+
     probeKey = 0
 
     if probeID in probeDict:
         return probeDict[probeID]
+    elif probeID in probeMisses:
+        return 0
     else:
-        results = db.sql('select _Object_key from PRB_Acc_View where accID = \'%s\' ' % (probeID), 'auto')
+        results = statementlib.execute('verifyProbe', probeID)
 
         for r in results:
             if r['_Object_key'] is None:
                 if errorFile != None:
-                    errorFile.write('Invalid Mouse Probe (row %d) %s\n' % (lineNum, probeID))
+                    errorlib.report(errorFile, 'Invalid Mouse Probe (row %d) %s\n', lineNum, probeID)
                 probeKey = 0
             else:
                 probeKey = r['_Object_key']
                 probeDict[probeID] = probeKey
 
+        if probeKey == 0:
+            probeMisses.add(probeID)
+
     return probeKey
 
 # Purpose:  verify Reference Accession ID
@@ -253,6 +548,9 @@ def verifyReference(
 
     global referenceDict
 
+    if deferred.mode:
+        return deferVerify(verifyReference, referenceID, lineNum, errorFile)
+
     if referenceID in referenceDict:
         referenceKey = referenceDict[referenceID]
     else:
@@ -260,10 +558,10 @@ def verifyReference(
 
         referenceDict[referenceID] = referenceKey
 
-        if referenceKey is None:
-            if errorFile != None:
-                errorFile.write('Invalid Reference (row %d): %s\n' % (lineNum, referenceID))
-            referenceKey = 0
+    if referenceKey is None:
+        if errorFile != None:
+            errorlib.report(errorFile, 'Invalid Reference (row %d): %s\n', lineNum, referenceID)
+        referenceKey = 0
 
     return referenceKey
 
@@ -274,6 +572,7 @@ def verifyReference(
 #	by either the Term ID or the Term Description/Term Vocabulary
 #	writes to the error file if the Term is invalid
 #	adds the Term id and key to the Term dictionary if the Term is valid
+#	a Term of a preloaded vocabulary (see preloadVocab) is verified from memory
 # Throws:  nothing
 
 def verifyTerm(
@@ -286,18 +585,26 @@ def verifyTerm(
 
     global termDict
 
+    if deferred.mode:
+        return deferVerify(verifyTerm, termID, vocabKey, termDescription, lineNum, errorFile)
+
     termKey = None
 
-    if len(termID) > 0 and termID in termDict:
-        return termDict[termID] 
+    if len(termID) > 0 and termID in termIDIndex:
+        termKey = termIDIndex[termID]
+
+    elif len(termID) == 0 and preloadedVocab(vocabKey) is not None:
+        termKey = termNameIndex[preloadedVocab(vocabKey)].get(termDescription)
+
+    elif len(termID) > 0 and termID in termDict:
+        termKey = termDict[termID]
 
     elif len(termDescription) > 0 and vocabKey \
         and (vocabKey, termDescription) in termDict:
-        return termDict[(vocabKey, termDescription)]
+        termKey = termDict[(vocabKey, termDescription)]
 
     elif len(termID) > 0:
-        results = db.sql('select a._Object_key from VOC_Term_Acc_View a ' + \
-            'where a.accID = \'%s\' ' % (termID), 'auto')
+        results = statementlib.execute('verifyTerm', termID)
 
         for r in results:
             termKey = r['_Object_key']
@@ -305,9 +612,7 @@ def verifyTerm(
         termDict[termID] = termKey
     else:
         # optional search by VOC_Term.term as termDescription
-        results = db.sql('select _Term_key from VOC_Term ' + \
-                'where term = \'%s\' ' % (termDescription) + \
-                'and _Vocab_key = %s' % (vocabKey), 'auto')
+        results = statementlib.execute('verifyTermDescription', termDescription, vocabKey)
 
         for r in results:
             termKey = r['_Term_key']
@@ -317,7 +622,7 @@ def verifyTerm(
 
     if termKey is None:
         if errorFile != None:
-            errorFile.write('Invalid Term (row:[%d]: termID:[%s] term [%s]\n' % (lineNum, termID, termDescription))
+            errorlib.report(errorFile, 'Invalid Term (row:[%d]: termID:[%s] term [%s]\n', lineNum, termID, termDescription)
         termKey = 0
 
     return termKey
@@ -339,13 +644,16 @@ def verifyUser(
 
     global userDict
 
+    if deferred.mode:
+        return deferVerify(verifyUser, userID, lineNum, errorFile)
+
     userKey = None
 
     if userID in userDict:
         userKey = userDict[userID]
 
     else:
-        results = db.sql('select _User_key from MGI_User where login = \'%s\' ' % (userID), 'auto')
+        results = statementlib.execute('verifyUser', userID)
         for r in results:
             userKey = r['_User_key']
 
@@ -353,7 +661,7 @@ def verifyUser(
 
     if userKey is None:
         if errorFile != None:
-            errorFile.write('Invalid User (row %d): %s\n' % (lineNum, userID))
+            errorlib.report(errorFile, 'Invalid User (row %d): %s\n', lineNum, userID)
         userKey = 0
 
     return userKey
@@ -373,17 +681,813 @@ def verifyMarkerType(
 
     global markerTypeDict
 
+    if deferred.mode:
+        return deferVerify(verifyMarkerType, markerType, lineNum, errorFile)
+
     markerTypeKey = 0
 
     if len(markerTypeDict) == 0:
-        results = db.sql('select _Marker_Type_key, name from MRK_Types', 'auto')
-        for r in results:
-            markerTypeDict[r['name']] = r['_Marker_Type_key']
+        tablelib.load('markerType')
 
     if markerType in markerTypeDict:
         markerTypeKey = markerTypeDict[markerType]
     else:
         if errorFile != None:
-            errorFile.write('Invalid Marker Type (row %d): %s\n' % (lineNum, markerType))
+            errorlib.report(errorFile, 'Invalid Marker Type (row %d): %s\n', lineNum, markerType)
 
     return markerTypeKey
+
+# Purpose:  splits a list of accession IDs into chunks of at most
+#	prefetchChunkSize IDs
+# Returns:  list of lists
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def chunkList(
+    idList	# list of accession IDs (list of str.
+    ):
+
+    return [idList[i:i + prefetchChunkSize] for i in range(0, len(idList), prefetchChunkSize)]
+
+# Purpose:  formats a list of values for use in an SQL "in (...)" clause
+# Returns:  str. of quoted, comma-separated values
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def sqlList(
+    valueList	# list of values (list of str.
+    ):
+
+    return ','.join(['\'%s\'' % (str.replace(str(x), '\'', '\'\'')) for x in valueList])
+
+# Purpose:  prefetch Marker Accession IDs
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  adds the id and key of every valid Marker in markerIDList to the
+#	Marker dictionary using one query per chunk of IDs
+#	so that verifyMarker can be answered from the dictionary
+# Throws:  nothing
+
+def prefetchMarkers(
+    markerIDList,	# list of Marker Accession IDs (list of str.
+    organism = 'mouse, laboratory'
+    ):
+
+    global markerDict
+
+    idList = [x for x in dict.fromkeys(markerIDList) \
+        if (x, organism) not in markerDict and not markerMisses.has((x, organism))]
+
+    if organism in markerIndex:
+        idList = [x for x in idList if markerNumber(x) is None]
+
+    for chunk in chunkList(idList):
+        results = db.sql('select a.accID, a._Object_key ' + \
+            'from MRK_Acc_View a, MRK_Marker m, MGI_Organism o ' + \
+            'where a.accID in (%s) ' % (sqlList(chunk)) + \
+            'and a._LogicalDB_key = 1 ' + \
+            'and a._Object_key = m._Marker_key ' + \
+            'and m._Organism_key = o._Organism_key ' + \
+            'and o.commonName = \'%s\' ' % (organism), 'auto')
+
+        for r in results:
+            if r['_Object_key'] is not None:
+                markerDict[(r['accID'], organism)] = r['_Object_key']
+
+        for markerID in chunk:
+            if (markerID, organism) not in markerDict:
+                markerMisses.add((markerID, organism))
+
+# Purpose:  prefetch Probe Accession IDs
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  adds the id and key of every valid Probe in probeIDList to the
+#	Probe dictionary using one query per chunk of IDs
+# Throws:  nothing
+
+def prefetchProbes(
+    probeIDList		# list of Probe Accession IDs (list of str.
+    ):
+
+    global probeDict
+
+    idList = [x for x in dict.fromkeys(probeIDList) \
+        if x not in probeDict and not probeMisses.has(x)]
+
+    for chunk in chunkList(idList):
+        results = db.sql('select accID, _Object_key from PRB_Acc_View ' + \
+            'where accID in (%s)' % (sqlList(chunk)), 'auto')
+
+        for r in results:
+            if r['_Object_key'] is not None:
+                probeDict[r['accID']] = r['_Object_key']
+
+        for probeID in chunk:
+            if probeID not in probeDict:
+                probeMisses.add(probeID)
+
+# Purpose:  prefetch Reference Accession IDs
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  adds every id in referenceIDList to the Reference dictionary
+#	using one query per chunk of IDs
+#	invalid ids are stored with a key of None, as in verifyReference
+# Throws:  nothing
+
+def prefetchReferences(
+    referenceIDList	# list of Reference Accession IDs (list of str.
+    ):
+
+    global referenceDict
+
+    idList = [x for x in dict.fromkeys(referenceIDList) if x not in referenceDict]
+
+    for chunk in chunkList(idList):
+        results = db.sql('select accID, _Object_key from ACC_Accession ' + \
+            'where accID in (%s) ' % (sqlList(chunk)) + \
+            'and _MGIType_key = 1', 'auto')
+
+        found = set()
+        for r in results:
+            referenceDict[r['accID']] = r['_Object_key']
+            found.add(r['accID'])
+
+        for referenceID in chunk:
+            if referenceID not in found:
+                referenceDict[referenceID] = None
+
+# Purpose:  prefetch Term Accession IDs
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  adds every id in termIDList to the Term dictionary
+#	using one query per chunk of IDs
+#	invalid ids are stored with a key of None, as in verifyTerm
+# Throws:  nothing
+
+def prefetchTerms(
+    termIDList		# list of Term Accession IDs (list of str.
+    ):
+
+    global termDict
+
+    idList = [x for x in dict.fromkeys(termIDList) \
+        if len(x) > 0 and x not in termDict and x not in termIDIndex]
+
+    for chunk in chunkList(idList):
+        results = db.sql('select a.accID, a._Object_key from VOC_Term_Acc_View a ' + \
+            'where a.accID in (%s)' % (sqlList(chunk)), 'auto')
+
+        found = set()
+        for r in results:
+            termDict[r['accID']] = r['_Object_key']
+            found.add(r['accID'])
+
+        for termID in chunk:
+            if termID not in found:
+                termDict[termID] = None
+
+# Purpose:  prefetch User logins
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  adds the login and key of every User in userIDList to the
+#	User dictionary using one query per chunk of logins;
+#	an invalid login is added with key None
+# Throws:  nothing
+
+def prefetchUsers(
+    userIDList		# list of User logins (list of str.
+    ):
+
+    global userDict
+
+    idList = [x for x in dict.fromkeys(userIDList) if x not in userDict]
+
+    for chunk in chunkList(idList):
+        results = db.sql('select login, _User_key from MGI_User ' + \
+            'where login in (%s)' % (sqlList(chunk)), 'auto')
+
+        found = set()
+        for r in results:
+            userDict[r['login']] = r['_User_key']
+            found.add(r['login'])
+
+        for userID in chunk:
+            if userID not in found:
+                userDict[userID] = None
+
+# Purpose:  checks whether a vocabulary has been preloaded
+# Returns:  the Vocabulary key (integer) if it has, else None
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def preloadedVocab(
+    vocabKey	# Vocabulary key (str. or integer)
+    ):
+
+    if len(termNameIndex) == 0:
+        return None
+
+    try:
+        vocabKey = int(vocabKey)
+    except (TypeError, ValueError):
+        return None
+
+    if vocabKey in termNameIndex:
+        return vocabKey
+
+    return None
+
+# Purpose:  preloads the Terms of a vocabulary
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  loads every Term of the vocabulary and its Accession IDs in
+#	one query, into the Term ID index and the Term name index of the
+#	vocabulary; verifyTerm then verifies any Term given with this
+#	vocabulary key from memory;
+#	with reload = 1, loads the vocabulary again: adds the new Terms and
+#	IDs, then removes the old ones
+# Throws:  nothing
+
+def preloadVocab(
+    vocabKey,	# Vocabulary key (integer)
+    reload = 0	# 1 = load the vocabulary even if it is loaded (integer)
+    ):
+
+    global termIDIndex, termNameIndex
+
+    vocabKey = int(vocabKey)
+
+    if vocabKey in termNameIndex and not reload:
+        return
+
+    version = indexSignature(termIndexSignatureQuery(vocabKey))
+    oldKeys = set(termNameIndex.get(vocabKey, {}).values())
+    names = {}
+    ids = {}
+
+    results = db.sql('select t._Term_key, t.term, a.accID ' + termIndexRows(vocabKey), 'auto')
+
+    for r in results:
+        names[r['term']] = r['_Term_key']
+        if r['accID'] is not None:
+            ids[r['accID']] = r['_Term_key']
+
+    termIDIndex.update(ids)
+    termNameIndex[vocabKey] = names
+    indexVersions[('vocab', vocabKey)] = version
+
+    for termID, termKey in list(termIDIndex.items()):
+        if termKey in oldKeys and termID not in ids:
+            termIDIndex.pop(termID, None)
+
+# Purpose:  returns the from and where clauses of the Term index rows
+#	of a vocabulary
+# Returns:  str.
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def termIndexRows(
+    vocabKey	# Vocabulary key (integer)
+    ):
+
+    return 'from VOC_Term t left outer join VOC_Term_Acc_View a on (a._Object_key = t._Term_key) ' + \
+        'where t._Vocab_key = %d' % (vocabKey)
+
+# Purpose:  builds the signature query of the Term index of a vocabulary
+# Returns:  str.
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def termIndexSignatureQuery(
+    vocabKey	# Vocabulary key (integer)
+    ):
+
+    return 'select count(*) as rowCount, max(t.modification_date) as maxDate, ' + \
+        'max(a.modification_date) as maxAccDate ' + termIndexRows(vocabKey)
+
+# Purpose:  placeholder for the key of a lookup made in deferred mode
+#	the key is filled in by resolveDeferred
+#	str() and int() of a resolved DeferredKey return the key,
+#	so a DeferredKey can be used directly when writing output rows
+
+class DeferredKey:
+
+    def __init__(self, verifier, args):
+        self.verifier = verifier	# the verify* function
+        self.args = args		# its arguments, including lineNum and errorFile
+        self.key = None
+        self.resolved = 0
+
+    def value(self):
+        if not self.resolved:
+            raise ValueError('unresolved DeferredKey: %s%s' % (self.verifier.__name__, str(self.args)))
+        return self.key
+
+    def __str__(self):
+        return str(self.value())
+
+    def __int__(self):
+        return int(self.value())
+
+# Purpose:  the deferred mode of one thread
+#	mode:  if 1, verify* functions return a DeferredKey (see resolveDeferred)
+#	pending:  pending DeferredKey lookups, in the order they were made
+#	each thread has its own, so a thread in deferred mode (or in
+#	streamRows) does not change what the verifiers return to another
+
+class DeferredState(threading.local):
+
+    def __init__(self):
+        self.mode = 0
+        self.pending = []
+
+deferred = DeferredState()	# the deferred mode and pending lookups of each thread
+
+# Purpose:  turns deferred mode on or off
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  while deferred mode is on, the verify* functions of loadlib and
+#	sourceloadlib return a DeferredKey instead of a key
+#	in the calling thread only
+# Throws:  nothing
+
+def setDeferred(
+    flag	# 1 = deferred, 0 = immediate (integer)
+    ):
+
+    deferred.mode = flag
+
+# Purpose:  records a deferred lookup
+# Returns:  DeferredKey
+# Assumes:  nothing
+# Effects:  adds the lookup to the pending list of the calling thread
+# Throws:  nothing
+
+def deferVerify(
+    verifier,	# verify* function
+    *args	# its arguments
+    ):
+
+    d = DeferredKey(verifier, args)
+    deferred.pending.append(d)
+    return d
+
+# Purpose:  resolves all pending deferred lookups of the calling thread
+# Returns:  nothing
+# Assumes:  with workers > 1, db.sql may be called from several threads
+#	at once and opens its own connection for each call (the db default);
+#	no connection pool is kept here, so under db.useOneConnection(1) the
+#	threads would share one connection and their round trips could not
+#	overlap: that mode is not supported, and while prepared statements
+#	are on (statementlib.setPrepare(1), which needs one connection)
+#	the batch resolvers run one after another, as with workers = 1
+# Effects:  prefetches the pending lookups of every verifier that has a
+#	batch resolver, then runs each lookup in the order it was made,
+#	so error lines carry the original lineNum and are written in input order
+#	with workers > 1, the batch resolvers of the different verifiers run
+#	at the same time on a pool of that many threads, so the database
+#	round trips for Markers, Terms, References, Users... overlap
+#	fills in the key of each DeferredKey
+# Throws:  nothing
+
+def resolveDeferred(
+    workers = 1		# number of batch resolvers run at the same time (integer)
+    ):
+
+    if statementlib.usePrepared:
+        workers = 1
+
+    pending = deferred.pending
+    deferred.pending = []
+
+    saveMode = deferred.mode
+    deferred.mode = 0
+
+    try:
+        groups = {}
+        for d in pending:
+            groups.setdefault(d.verifier.__name__, []).append(d)
+
+        names = [x for x in groups if x in batchResolvers]
+
+        if workers > 1 and len(names) > 1:
+            pool = resolverPool(workers)
+            futures = [pool.submit(batchResolvers[x], groups[x]) for x in names]
+            for f in futures:
+                f.result()
+        else:
+            for name in names:
+                batchResolvers[name](groups[name])
+
+        for d in pending:
+            d.key = d.verifier(*d.args)
+            d.resolved = 1
+    finally:
+        deferred.mode = saveMode
+
+# Purpose:  returns the thread pool used by resolveDeferred
+# Returns:  concurrent.futures.ThreadPoolExecutor
+# Assumes:  nothing
+# Effects:  creates one pool per number of workers, the first time it is
+#	asked for; pools are kept for the life of the process
+# Throws:  nothing
+
+def resolverPool(
+    workers	# number of threads (integer)
+    ):
+
+    global resolvePools
+
+    # a pool is never shut down: another thread may still be using it
+    with resolvePoolLock:
+        if workers not in resolvePools:
+            resolvePools[workers] = concurrent.futures.ThreadPoolExecutor(max_workers = workers, \
+                thread_name_prefix = 'loadlib')
+
+        return resolvePools[workers]
+
+# Purpose:  returns the key of a value that may be a DeferredKey
+# Returns:  the key
+# Assumes:  resolveDeferred has been called
+# Effects:  nothing
+# Throws:  ValueError if the DeferredKey has not been resolved
+
+def resolveValue(
+    value	# key or DeferredKey
+    ):
+
+    if isinstance(value, DeferredKey):
+        return value.value()
+
+    return value
+
+# Purpose:  returns a copy of an output row with every DeferredKey replaced by its key
+# Returns:  list
+# Assumes:  resolveDeferred has been called
+# Effects:  nothing
+# Throws:  ValueError if a DeferredKey has not been resolved
+
+def resolveRow(
+    row		# list of values and/or DeferredKeys
+    ):
+
+    return [resolveValue(x) for x in row]
+
+# Purpose:  verifies a tab-delimited input file, one chunk of rows at a time
+# Returns:  generator of (lineNum, fields, keys, valid) per data row:
+#	fields = list of the row's values
+#	keys = list of the keys returned by the verifiers, in mapping order
+#	valid = 1 if no key is 0, else 0
+# Assumes:  each verifier takes the column value(s), then the extra
+#	arguments of its mapping entry, then lineNum and errorFile
+# Effects:  reads the file; verifies each chunk in deferred mode, so the
+#	lookups of a chunk are batched (see resolveDeferred) and errors are
+#	written in input order; only one chunk is held in memory
+#	a row without a mapped column gets key 0 for it and a
+#	'Missing Column' error
+# Throws:  nothing
+#
+# Example:
+#
+#	mapping = [(0, loadlib.verifyMarker),
+#		   (1, loadlib.verifyTerm, ('', '')),
+#		   (2, loadlib.verifyReference),
+#		   (5, loadlib.verifyUser)]
+#
+#	for lineNum, fields, keys, valid in loadlib.streamRows(inFile, mapping, errorFile):
+#		if valid:
+#			...
+#
+#	A mapping entry is (column, verifier[, extra arguments[, keyword arguments]]);
+#	column may be a tuple of columns, passed as separate values
+#	(e.g. the eight columns of sourceloadlib.verifySource).
+
+def streamRows(
+    inFile,		# input file (file descriptor)
+    mapping,		# list of (column, verifier[, extra arguments[, keyword arguments]])
+    errorFile = None,	# error file (file descriptor or errorlib.ErrorSink)
+    delimiter = '\t',	# column delimiter (str.
+    skipLines = 0,	# number of header lines (integer)
+    chunkSize = None,	# rows per chunk; None = prefetchChunkSize (integer)
+    workers = 1		# see resolveDeferred (integer)
+    ):
+
+    if chunkSize is None:
+        chunkSize = prefetchChunkSize
+
+    chunk = []
+    lineNum = 0
+
+    for line in inFile:
+        lineNum = lineNum + 1
+        if lineNum <= skipLines:
+            continue
+        chunk.append((lineNum, line.rstrip('\r\n').split(delimiter)))
+        if len(chunk) >= chunkSize:
+            for row in verifyChunk(chunk, mapping, errorFile, workers):
+                yield row
+            chunk = []
+
+    for row in verifyChunk(chunk, mapping, errorFile, workers):
+        yield row
+
+# Purpose:  reports a mapped column missing from an input row
+# Returns:  0
+# Assumes:  nothing
+# Effects:  writes to the error file
+# Throws:  nothing
+
+def missingColumn(
+    column,	# column (integer or tuple)
+    lineNum,	# line number (integer)
+    errorFile	# error file (file descriptor)
+    ):
+
+    errorlib.report(errorFile, 'Missing Column (line: %d) %s\n', lineNum, column)
+    return 0
+
+# Purpose:  verifies one chunk of rows for streamRows
+# Returns:  list of (lineNum, fields, keys, valid)
+# Assumes:  nothing
+# Effects:  see streamRows
+# Throws:  nothing
+
+def verifyChunk(
+    chunk,	# list of (lineNum, fields)
+    mapping,	# see streamRows
+    errorFile,	# see streamRows
+    workers	# see streamRows
+    ):
+
+    if len(chunk) == 0:
+        return []
+
+    saveMode = deferred.mode
+    deferred.mode = 1
+
+    try:
+        pending = []
+        for lineNum, fields in chunk:
+            keys = []
+            for entry in mapping:
+                column = entry[0]
+                extra = ()
+                keywords = {}
+                if len(entry) > 2:
+                    extra = tuple(entry[2])
+                if len(entry) > 3:
+                    keywords = entry[3]
+                try:
+                    if isinstance(column, tuple):
+                        values = tuple([fields[c] for c in column])
+                    else:
+                        values = (fields[column],)
+                except IndexError:
+                    keys.append(deferVerify(missingColumn, column, lineNum, errorFile))
+                    continue
+                keys.append(entry[1](*(values + extra + (lineNum, errorFile)), **keywords))
+            pending.append(keys)
+    finally:
+        deferred.mode = saveMode
+
+    resolveDeferred(workers)
+
+    rows = []
+    for (lineNum, fields), keys in zip(chunk, pending):
+        keys = resolveRow(keys)
+        valid = 1
+        for key in keys:
+            if key == 0:
+                valid = 0
+        rows.append((lineNum, fields, keys, valid))
+
+    return rows
+
+# Purpose:  a buffered writer of bulk-load (BCP/COPY) rows
+#
+#	writer = loadlib.BCPWriter(bcpFile, userKey = 1001, dates = 1)
+#	writer.writeRow([accessionKey, accID, ...])
+#	writer.close()
+#
+#	writes accessionKey|accID|...|1001|1001|<loaddate>|<loaddate>
+#
+#	sink is anything with a write(str.) method: an output file,
+#	or a CopySink to stream the rows straight into COPY
+#	values: None is written as nullValue; in strings, the backslash,
+#	the delimiter, newline and carriage return are escaped as COPY
+#	(text format) expects; other values are written with str()
+#	rows are formatted into a buffer and written every bufferRows rows
+#	a writer is not shared between threads
+#
+#	Each row is formatted with one "%s|%s|..." format; the escaping is
+#	checked once per buffer (no backslash, carriage return, extra newline
+#	or extra delimiter anywhere), and only a buffer that fails the check
+#	is formatted again value by value.
+
+class BCPWriter:
+
+    def __init__(self, sink, delimiter = '|', nullValue = '', userKey = None, dates = 0, bufferRows = 10000):
+        self.sink = sink
+        self.delimiter = delimiter
+        self.nullValue = nullValue
+        self.bufferRows = bufferRows
+        self.buffer = []	# formatted rows
+        self.values = []	# the values of each buffered row
+        self.delimiters = 0	# number of delimiters expected in the buffer
+        self.formats = {}	# number of values : (row format, delimiters per row)
+        self.rows = 0		# rows written
+        self.escapes = str.maketrans({'\\' : '\\\\', delimiter : '\\' + delimiter,
+            '\n' : '\\n', '\r' : '\\r'})
+
+        # columns appended to every row: _CreatedBy_key, _ModifiedBy_key,
+        # creation_date, modification_date
+        stamp = []
+        if userKey is not None:
+            stamp = stamp + [str(userKey), str(userKey)]
+        if dates:
+            stamp = stamp + [loaddate, loaddate]
+        if len(stamp) > 0:
+            self.suffix = delimiter + delimiter.join(stamp) + '\n'
+        else:
+            self.suffix = '\n'
+
+    def format(self, value):
+        if value is None:
+            return self.nullValue
+        if isinstance(value, str):
+            return value.translate(self.escapes)
+        return str(value)
+
+    def writeRow(self, values):
+        self.writeRows((values,))
+
+    def writeRows(self, rows):
+        for values in rows:
+            n = len(values)
+            if n not in self.formats:
+                f = self.delimiter.join(['%s'] * n) + self.suffix
+                self.formats[n] = (f, f.count(self.delimiter))
+            f, delimiters = self.formats[n]
+            values = tuple(values)
+            if None in values:
+                self.buffer.append(f % tuple([self.nullValue if x is None else x for x in values]))
+            else:
+                self.buffer.append(f % values)
+            self.values.append(values)
+            self.delimiters = self.delimiters + delimiters
+            if len(self.buffer) >= self.bufferRows:
+                self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+
+        text = ''.join(self.buffer)
+        if '\\' in text or '\r' in text or text.count('\n') != len(self.buffer) \
+            or text.count(self.delimiter) != self.delimiters:
+            text = ''.join([self.delimiter.join([self.format(x) for x in values]) + self.suffix \
+                for values in self.values])
+
+        self.sink.write(text)
+        self.rows = self.rows + len(self.buffer)
+        self.buffer = []
+        self.values = []
+        self.delimiters = 0
+
+    def close(self):
+        self.flush()
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+
+# Purpose:  a BCPWriter sink that streams the rows into a COPY
+#
+#	sink = loadlib.CopySink(lambda fp: cursor.copy_expert(
+#		"copy ACC_Accession from stdin with delimiter '|' null ''", fp))
+#
+#	copy is called with a file object holding each block of rows
+#	(at least blockSize characters, and the rest at close)
+
+class CopySink:
+
+    def __init__(self, copy, blockSize = 1 << 20):
+        self.copy = copy
+        self.blockSize = blockSize
+        self.blocks = []
+        self.size = 0
+
+    def write(self, text):
+        self.blocks.append(text)
+        self.size = self.size + len(text)
+        if self.size >= self.blockSize:
+            self.flush()
+
+    def flush(self):
+        if self.size > 0:
+            self.copy(io.StringIO(''.join(self.blocks)))
+            self.blocks = []
+            self.size = 0
+
+    def close(self):
+        self.flush()
+
+# Purpose:  hands out new primary keys of a table, reserved in blocks
+#
+#	allocator = loadlib.KeyAllocator('ACC_Accession')
+#	accessionKey = allocator.next()
+#
+#	each block of blockSize keys is reserved with one query on the
+#	table's sequence (e.g. acc_accession_seq), so the keys never
+#	collide with those of another process or of the database itself
+#	a block's unused keys are lost at exit (gaps in the sequence)
+#	an allocator may be shared by several threads
+
+class KeyAllocator:
+
+    def __init__(self, table, blockSize = 1000, sequence = None):
+        if sequence is None:
+            sequence = '%s_seq' % (table.lower())
+        self.table = table
+        self.blockSize = blockSize
+        self.sequence = sequence
+        self.keys = []		# reserved keys not yet handed out, last one first
+        self.lock = threading.Lock()
+
+    def reserve(self, n):
+        results = db.sql('select nextval(\'%s\') as key from generate_series(1, %d)' \
+            % (self.sequence, n), 'auto')
+        keys = [r['key'] for r in results]
+        keys.sort(reverse = True)
+        return keys
+
+    def next(self):
+        with self.lock:
+            if len(self.keys) == 0:
+                self.keys = self.reserve(self.blockSize)
+            return self.keys.pop()
+
+    def nextBlock(self, n):
+        if n <= 0:
+            return []
+        with self.lock:
+            if n > len(self.keys):
+                self.keys = self.keys + self.reserve(n - len(self.keys))
+                self.keys.sort(reverse = True)
+            block = self.keys[-n:]
+            del self.keys[-n:]
+            block.reverse()
+            return block
+
+# Purpose:  returns a new primary key of a table
+# Returns:  integer
+# Assumes:  the table has a sequence named <table>_seq
+# Effects:  creates the table's KeyAllocator the first time
+# Throws:  nothing
+
+def nextKey(
+    table	# table name, e.g. 'ACC_Accession' (str.
+    ):
+
+    with keyAllocatorsLock:
+        if table not in keyAllocators:
+            keyAllocators[table] = KeyAllocator(table)
+
+    return keyAllocators[table].next()
+
+#
+# batch resolvers used by resolveDeferred
+#
+
+def batchMarkers(pending):
+    organisms = {}
+    for d in pending:
+        organisms.setdefault(d.args[4], []).append(d.args[0])
+    for organism in organisms:
+        prefetchMarkers(organisms[organism], organism)
+
+def batchProbes(pending):
+    prefetchProbes([d.args[0] for d in pending])
+
+def batchReferences(pending):
+    prefetchReferences([d.args[0] for d in pending])
+
+def batchTerms(pending):
+    prefetchTerms([d.args[0] for d in pending])
+
+def batchUsers(pending):
+    prefetchUsers([d.args[0] for d in pending])
+
+batchResolvers['verifyMarker'] = batchMarkers
+batchResolvers['verifyProbe'] = batchProbes
+batchResolvers['verifyReference'] = batchReferences
+batchResolvers['verifyTerm'] = batchTerms
+batchResolvers['verifyUser'] = batchUsers
+
+tablelib.refreshers.append(cachelib.clearMisses)
+tablelib.refreshers.append(refreshIndexes)
+
+statslib.register(__name__)
@@ -0,0 +1,287 @@
+#
+# Program: sharedlib.py
+#
+# Purpose:
+#
+#	Share the preloaded lookup tables of the data load libraries
+#	(the tablelib tables, sourceloadlib.libraryDict and libraryIDDict)
+#	between the processes of a multi-process load.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	in the parent process, before the workers are started:
+#
+#	sharedlib.publish(logicalDBKeys = [9])
+#
+#	in each worker process:
+#
+#	sharedlib.attach()
+#
+#	The workers then call the verifiers as usual; the shared tables are
+#	read in place, without copying them and without querying the database.
+#
+# Envvars:
+#
+#	DATALOAD_SHARED		full path of the table file; set by publish()
+#				and inherited by the workers
+#
+# Inputs:
+#
+#	the table file (attach)
+#
+# Outputs:
+#
+#	the table file (publish)
+#
+# Exit Codes:
+#
+# Assumes:
+#
+#	the table keys are strings and the values are integers
+#
+# Bugs:
+#
+# Implementation:
+#
+#	publish() writes every table into one file, by default in /dev/shm
+#	(memory, not disk).  attach() maps the file read-only into each
+#	worker, so all the workers share one copy of the tables, and puts a
+#	SharedTable in place of each module dictionary.
+#
+#	File layout:
+#
+#	header		magic, version, directory length
+#	directory	JSON dictionary of table name : [offset, slots, count],
+#			offsets counted from the end of the directory
+#	tables		each table is an open-addressing hash table:
+#			slots (hash, key offset, key length, value), then the
+#			UTF-8 keys; a slot with key offset 0 is empty
+#
+#	The hash is the CRC-32 of the key, which, unlike hash(), is the same
+#	in every process.
+#
+
+import sys
+import os
+import atexit
+import json
+import mmap
+import struct
+import tempfile
+import zlib
+import collections.abc
+import sourceloadlib
+import tablelib
+
+#globals
+
+MAGIC = b'DLST'
+VERSION = 2
+
+headerFormat = struct.Struct('<4sII')	# magic, version, directory length
+slotFormat = struct.Struct('<IIIq')	# hash, key offset, key length, value
+
+sharedFile = None	# the mapped table file (mmap) once attach() has run
+
+# Purpose:  a read-only dictionary of str. : integer held in the table file
+
+class SharedTable(collections.abc.Mapping):
+
+    def __init__(self, buffer, offset, slots, count):
+        self.buffer = buffer
+        self.offset = offset
+        self.slots = slots
+        self.count = count
+
+    def find(self, key):
+        if not isinstance(key, str):
+            return None
+        k = key.encode('utf-8')
+        h = zlib.crc32(k)
+        mask = self.slots - 1
+        i = h & mask
+        while 1:
+            slotHash, keyOffset, keyLength, value = \
+                slotFormat.unpack_from(self.buffer, self.offset + i * slotFormat.size)
+            if keyOffset == 0:
+                return None
+            if slotHash == h and keyLength == len(k) \
+                and self.buffer[self.offset + keyOffset:self.offset + keyOffset + keyLength] == k:
+                return value
+            i = (i + 1) & mask
+
+    def __getitem__(self, key):
+        value = self.find(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.slots):
+            slotHash, keyOffset, keyLength, value = \
+                slotFormat.unpack_from(self.buffer, self.offset + i * slotFormat.size)
+            if keyOffset != 0:
+                yield self.buffer[self.offset + keyOffset:self.offset + keyOffset + keyLength].decode('utf-8')
+
+# Purpose:  encodes one table
+# Returns:  bytes, number of slots
+# Assumes:  the keys are strings and the values integers
+# Effects:  nothing
+# Throws:  TypeError if a key is not a string or a value not an integer
+
+def encodeTable(
+    table	# dictionary of str. : integer
+    ):
+
+    slots = 8
+    while slots < 2 * len(table):
+        slots = slots * 2
+
+    slotArea = bytearray(slots * slotFormat.size)
+    keyArea = bytearray()
+    mask = slots - 1
+
+    for key, value in table.items():
+        if not isinstance(key, str) or not isinstance(value, int):
+            raise TypeError('cannot share %s : %s' % (repr(key), repr(value)))
+        k = key.encode('utf-8')
+        h = zlib.crc32(k)
+        i = h & mask
+        while slotFormat.unpack_from(slotArea, i * slotFormat.size)[1] != 0:
+            i = (i + 1) & mask
+        slotFormat.pack_into(slotArea, i * slotFormat.size, h, len(slotArea) + len(keyArea), len(k), value)
+        keyArea.extend(k)
+
+    return bytes(slotArea + keyArea), slots
+
+# Purpose:  writes the lookup tables to the table file
+# Returns:  the full path of the table file
+# Assumes:  called in the parent process before the workers are started
+# Effects:  loads every shared tablelib table (see tablelib.warmup), the
+#	Libraries and the Library IDs of the given Logical DBs that are not
+#	loaded yet;
+#	writes the table file; sets DATALOAD_SHARED
+#	a file created here is removed when this process exits
+#	tables that are empty or cannot be encoded are not shared
+# Throws:  nothing
+
+def publish(
+    path = None,	# full path of the table file; None = a new file (str.
+    logicalDBKeys = []	# Logical DBs whose Library IDs are shared (list of integers)
+    ):
+
+    tables = {}
+
+    names = [x for x in tablelib.tables if tablelib.tables[x].shared]
+    tablelib.warmup(names)
+
+    for name in names:
+        tables[name] = tablelib.tables[name].dictionary()
+
+    sourceloadlib.preloadLibraries()
+    tables['library'] = sourceloadlib.libraryDict
+
+    sourceloadlib.preloadLibraryIDs(logicalDBKeys)
+    for logicalDBKey in logicalDBKeys:
+        tables['libraryID:%d' % (int(logicalDBKey))] = sourceloadlib.libraryIDDict[int(logicalDBKey)]
+
+    directory = {}
+    body = bytearray()
+
+    for name, table in tables.items():
+        if len(table) == 0:
+            continue
+        try:
+            data, slots = encodeTable(table)
+        except TypeError:
+            continue
+        directory[name] = (len(body), slots, len(table))
+        body.extend(data)
+
+    directoryData = json.dumps(directory).encode('utf-8')
+
+    if path is None:
+        if os.path.isdir('/dev/shm'):
+            fd, path = tempfile.mkstemp(prefix = 'dataload', dir = '/dev/shm')
+        else:
+            fd, path = tempfile.mkstemp(prefix = 'dataload')
+        os.close(fd)
+        atexit.register(remove, path, os.getpid())
+
+    with open(path, 'wb') as fp:
+        fp.write(headerFormat.pack(MAGIC, VERSION, len(directoryData)))
+        fp.write(directoryData)
+        fp.write(body)
+
+    os.environ['DATALOAD_SHARED'] = path
+
+    return path
+
+# Purpose:  removes the table file
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  removes the file, in the process that created it only
+#	(the workers may inherit the exit handler)
+# Throws:  nothing
+
+def remove(
+    path,	# full path of the table file (str.
+    pid		# process that created it (integer)
+    ):
+
+    if os.getpid() != pid:
+        return
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# Purpose:  uses the shared lookup tables
+# Returns:  nothing
+# Assumes:  publish() has written the table file
+# Effects:  maps the table file read-only and replaces the module
+#	dictionaries by the shared tables
+# Throws:  ValueError if the file is not a table file
+
+def attach(
+    path = None		# full path of the table file; None = DATALOAD_SHARED (str.
+    ):
+
+    global sharedFile
+
+    if path is None:
+        path = os.environ['DATALOAD_SHARED']
+
+    with open(path, 'rb') as fp:
+        buffer = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+
+    magic, version, directoryLength = headerFormat.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a dataload table file: %s' % (path))
+
+    start = headerFormat.size + directoryLength
+    directory = json.loads(buffer[headerFormat.size:start].decode('utf-8'))
+
+    for name, (offset, slots, count) in directory.items():
+        table = SharedTable(buffer, start + offset, slots, count)
+        if name in tablelib.tables:
+            t = tablelib.tables[name]
+            setattr(sys.modules[t.module], t.attr, table)
+            tablelib.filled.add(name)
+            tablelib.checked.add(name)
+        elif name == 'library':
+            sourceloadlib.libraryDict = table
+            sourceloadlib.libraryLoaded = 1
+        elif name.startswith('libraryID:'):
+            sourceloadlib.libraryIDDict[int(name.split(':')[1])] = table
+
+    sharedFile = buffer
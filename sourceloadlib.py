@@ -29,22 +29,69 @@
 
 import sys
 import os
+import struct
+import threading
 import agelib
+import cachelib
 import db
+import errorlib
+import loadlib
+import statementlib
+import statslib
+import tablelib
 
 #globals
 
 cellLineDict = {}
 genderDict = {}		# dictionary of Gender
 libraryDict = {}        # dictionary of Library names and Library keys
-libraryIDDict = {}      # dictionary of Library Ids and Library keys
-organismDict = {}	# dictionary of Organisms and keys
+libraryIDDict = {}      # Logical DB key : dictionary of Library Ids and Library keys
+organismDict = cachelib.cache(__name__, 'organismDict')	# dictionary of Organisms and keys
 segmentTypeDict = {}	# dictionary of Segment Types and keys
-sourceDict = {}		# dictionary of Source and keys
-strainDict = {}         # dictionary of Strain names and Strain keys
+sourceDict = cachelib.cache(__name__, 'sourceDict')	# dictionary of Source and keys
+strainDict = cachelib.cache(__name__, 'strainDict')	# dictionary of Strain names and Strain keys
 tissueDict = {}         # dictionary of Tissue names and Tissue keys
 vectorTypeDict = {}	# dictionary of Vector Types and keys
 
+tablelib.register('cellLine', __name__, 'cellLineDict', 'VOC_Term', 'term', '_Term_key', 'where _Vocab_key = 18')
+tablelib.register('gender', __name__, 'genderDict', 'VOC_Term', 'term', '_Term_key', 'where _Vocab_key = 17')
+tablelib.register('segmentType', __name__, 'segmentTypeDict', 'VOC_Term', 'term', '_Term_key', 'where _Vocab_key = 10')
+tablelib.register('tissue', __name__, 'tissueDict', 'PRB_Tissue', 'tissue', '_Tissue_key')
+tablelib.register('vectorType', __name__, 'vectorTypeDict', 'VOC_Term', 'term', '_Term_key', 'where _Vocab_key = 24')
+
+statementlib.register('verifyOrganism', 'select _Organism_key from MGI_Organism where commonName = $1')
+statementlib.register('verifySource', 'select _Source_key from PRB_Source where ' + \
+    '_SegmentType_key = $1 ' + \
+    'and _Vector_key = $2 ' + \
+    'and _Organism_key = $3 ' + \
+    'and _Strain_key = $4 ' + \
+    'and _Tissue_key = $5 ' + \
+    'and _Gender_key = $6 ' + \
+    'and _CellLine_key = $7 ' + \
+    'and age = $8 ' + \
+    'and isCuratorEdited = 0')
+statementlib.register('verifyStrain', 'select s._Strain_key ' + \
+    'from PRB_Strain s ' + \
+    'where s.strain = $1')
+
+sourceIndex = {}	# Source index key : Source key (see preloadSources)
+sourceAges = {}		# age : age number used in the Source index key
+sourceIndexLoaded = 0	# 1 once preloadSources has run
+sourceVersion = None	# signature of the PRB_Source rows in the Source index (see refreshSources)
+sourceKeyFormat = struct.Struct('<8i')	# Source index key
+
+libraryLoaded = 0	# 1 once every named PRB_Source row is in libraryDict
+libraryDeclared = 0	# 1 once declareLibraries has been called
+libraryThreshold = 1000	# declaring more Library names than this loads every Library
+libraryLock = threading.RLock()	# held while the Library dictionaries are loaded
+libraryDate = None	# max modification date of the loaded Libraries (see refreshLibraries)
+libraryIDDates = {}	# Logical DB key : max modification date of its loaded Library IDs
+
+libraryMisses = cachelib.missCache('Library')	# invalid Libraries
+organismMisses = cachelib.missCache('Organism')	# invalid Organisms
+sourceMisses = cachelib.missCache('Source')	# invalid Sources
+strainMisses = cachelib.missCache('Strain')	# invalid Strains
+
 genderList = ['Female', 'Male', 'Pooled', 'Not Specified']      # list of valid Gender values
 
 # Purpose: verifies the age value
@@ -63,10 +110,33 @@ def verifyAge(
 
     if ageMin is None:
         if errorFile != None:
-            errorFile.write('Invalid Age (line: %d) %s\n' % (lineNum, age))
+            errorlib.report(errorFile, 'Invalid Age (line: %d) %s\n', lineNum, age)
 
     return ageMin, ageMax 
 
+# Purpose: verifies a column of age values
+# Returns: ageMin, ageMax, valid; arrays with one element per age
+#          (see agelib.ageMinMaxArray)
+# Assumes: ages[i] was found on line lineNums[i] of the input file
+# Effects: writes to the error log for each age that cannot be parsed
+# Throws: nothing
+
+def verifyAges(
+    ages,        # the Age values from the input file (list of str.
+    lineNums,    # the line number of each Age value (list of integer)
+    errorFile	 # error file (file descriptor)
+    ):
+
+    ages = list(ages)
+    ageMin, ageMax, valid = agelib.ageMinMaxArray(ages)
+
+    if errorFile != None:
+        for i in range(len(valid)):
+            if not valid[i]:
+                errorlib.report(errorFile, 'Invalid Age (line: %d) %s\n', lineNums[i], ages[i])
+
+    return ageMin, ageMax, valid
+
 # Purpose: verifies the Cell Line
 # Returns: 0 if the Cell Line
 #		else the primary key of the Cell Line
@@ -83,16 +153,17 @@ def verifyCellLine(
 
     global cellLineDict
 
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifyCellLine, cellLine, lineNum, errorFile)
+
     if len(cellLineDict) == 0:
-        results = db.sql('select _Term_key, term from VOC_Term where _Vocab_key = 18', 'auto')
-        for r in results:
-            cellLineDict[r['term']] = r['_Term_key']
+        tablelib.load('cellLine')
 
     if cellLine in cellLineDict:
         return cellLineDict[cellLine]
     else:
         if errorFile != None:
-            errorFile.write('Invalid Cell Line (line: %d) %s\n' % (lineNum, cellLine))
+            errorlib.report(errorFile, 'Invalid Cell Line (line: %d) %s\n', lineNum, cellLine)
         return 0
 
 # Purpose: verifies the Library value
@@ -100,6 +171,8 @@ def verifyCellLine(
 #          else the primary key of the Library
 # Assumes: nothing
 # Effects: initializes the Library dictionary for quicker lookup
+#          if the load has not declared its Library names (see declareLibraries),
+#          else looks up each undeclared name as it is seen
 # Throws: nothing
 
 def verifyLibrary(
@@ -110,24 +183,106 @@ def verifyLibrary(
 
     global libraryDict
 
-    # if dictionary is empty, initialize it
-    if len(libraryDict) == 0:
-        results = db.sql('select _Source_key, name from PRB_Source where name is not null', 'auto')
-        for r in results:
-            libraryDict[r['name']] = r['_Source_key']
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifyLibrary, libraryName, lineNum, errorFile)
+
+    # if dictionary has not been initialized and no names were declared, initialize it
+    if not libraryLoaded and not libraryDeclared:
+        preloadLibraries()
 
     if libraryName in libraryDict:
         return libraryDict[libraryName] 
+
+    if not libraryLoaded and libraryName not in libraryMisses:
+        prefetchLibraries([libraryName])
+        if libraryName in libraryDict:
+            return libraryDict[libraryName]
+
+    if errorFile != None:
+        errorlib.report(errorFile, 'Invalid Library (line: %d) %s\n', lineNum, libraryName)
+    return 0
+
+# Purpose: declares the Library names the load will verify
+# Returns: nothing
+# Assumes: nothing
+# Effects: if there are more than libraryThreshold distinct names,
+#          loads every Library (preloadLibraries),
+#          else looks up only the given names (prefetchLibraries);
+#          verifyLibrary then looks up any other name as it is seen
+# Throws: nothing
+
+def declareLibraries(
+    libraryList	# list of Library names (list of str.
+    ):
+
+    global libraryDeclared
+
+    libraryDeclared = 1
+    nameList = list(dict.fromkeys(libraryList))
+
+    if len(nameList) > libraryThreshold:
+        preloadLibraries()
     else:
-        if errorFile != None:
-            errorFile.write('Invalid Library (line: %d) %s\n' % (lineNum, libraryName))
-        return 0
+        prefetchLibraries(nameList)
+
+# Purpose: loads every Library
+# Returns: nothing
+# Assumes: nothing
+# Effects: initializes the Library dictionary with every named PRB_Source row
+# Throws: nothing
+
+def preloadLibraries():
+
+    global libraryDict, libraryLoaded, libraryDate
+
+    with libraryLock:
+        if libraryLoaded:
+            return
+
+        results = db.sql('select _Source_key, name, modification_date from PRB_Source where name is not null', 'auto')
+        for r in results:
+            libraryDict[r['name']] = r['_Source_key']
+
+        libraryDate = maxDate(results, None)
+        libraryLoaded = 1
+
+# Purpose:  prefetch Library names
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  adds the name and key of every valid Library in libraryList to the
+#	Library dictionary using one query per chunk of names;
+#	records the invalid names; does nothing once every Library is loaded
+# Throws:  nothing
+
+def prefetchLibraries(
+    libraryList		# list of Library names (list of str.
+    ):
+
+    global libraryDict
+
+    if libraryLoaded:
+        return
+
+    nameList = [x for x in dict.fromkeys(libraryList) \
+        if x not in libraryDict and not libraryMisses.has(x)]
+
+    for chunk in loadlib.chunkList(nameList):
+        results = db.sql('select _Source_key, name from PRB_Source ' + \
+            'where name in (%s)' % (loadlib.sqlList(chunk)), 'auto')
+
+        for r in results:
+            libraryDict[r['name']] = r['_Source_key']
+
+        for name in chunk:
+            if name not in libraryDict:
+                libraryMisses.add(name)
 
 # Purpose: verifies the Library value by ID
 # Returns: 0 if the Library does not exist in MGI
 #          else the primary key of the Library
 # Assumes: nothing
-# Effects: initializes the Library dictionary for quicker lookup
+# Effects: initializes the Library ID dictionary of the Logical DB
+#          for quicker lookup
 # Throws: nothing
 
 def verifyLibraryID(
@@ -139,22 +294,154 @@ def verifyLibraryID(
 
     global libraryIDDict
 
-    # if dictionary is empty, initialize it
-    if len(libraryIDDict) == 0:
-        results = db.sql('select _LogicalDB_key, _Object_key, accID from PRB_Source_Acc_View', 'auto')
-        for r in results:
-            key = str(r['_LogicalDB_key']) + ':' + r['accID']
-            value = r['_Object_key']
-            libraryIDDict[key] = value
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifyLibraryID, libraryID, logicalDBKey, lineNum, errorFile)
+
+    try:
+        logicalDBKey = int(logicalDBKey)
+    except (TypeError, ValueError):
+        logicalDBKey = None
 
-    key = str(logicalDBKey) + ':' + libraryID
-    if key in libraryIDDict:
-        return libraryIDDict[key] 
+    # if the Logical DB has not been loaded, initialize it
+    if logicalDBKey is not None and logicalDBKey not in libraryIDDict:
+        preloadLibraryIDs([logicalDBKey])
+
+    if logicalDBKey is not None and libraryID in libraryIDDict[logicalDBKey]:
+        return libraryIDDict[logicalDBKey][libraryID] 
     else:
         if errorFile != None:
-            errorFile.write('Invalid Library ID (line: %d) %s\n' % (lineNum, libraryID))
+            errorlib.report(errorFile, 'Invalid Library ID (line: %d) %s\n', lineNum, libraryID)
         return 0
 
+# Purpose: loads the Library IDs of the given Logical DBs
+# Returns: nothing
+# Assumes: nothing
+# Effects: initializes the Library ID dictionary of each Logical DB
+#          not yet loaded (or each one, with reload), in one query;
+#          a load that declares its Logical DBs up front never reads
+#          the other Logical DBs
+# Throws: nothing
+
+def preloadLibraryIDs(
+    logicalDBKeys,	# the Logical DB keys (list of integers)
+    reload = 0		# 1 = also reload the Logical DBs already loaded
+    ):
+
+    global libraryIDDict
+
+    with libraryLock:
+        partitions = {}
+        for k in logicalDBKeys:
+            k = int(k)
+            if k not in libraryIDDict or reload:
+                partitions[k] = {}
+
+        if len(partitions) == 0:
+            return
+
+        results = db.sql('select _LogicalDB_key, _Object_key, accID, modification_date from PRB_Source_Acc_View ' + \
+            'where _LogicalDB_key in (%s)' % (','.join([str(k) for k in partitions])), 'auto')
+        for r in results:
+            partitions[r['_LogicalDB_key']][r['accID']] = r['_Object_key']
+
+        for k in partitions:
+            libraryIDDates[k] = maxDate([r for r in results if r['_LogicalDB_key'] == k], None)
+
+        # each partition is added only once it is complete
+        libraryIDDict.update(partitions)
+
+# Purpose: returns the max modification date of some rows
+# Returns: the date, or 'date' if there are no rows
+# Assumes: nothing
+# Effects: nothing
+# Throws: nothing
+
+def maxDate(
+    results,	# rows with a modification_date (list of dictionaries)
+    date	# date returned if there are no rows
+    ):
+
+    dates = [r['modification_date'] for r in results if r['modification_date'] is not None]
+
+    if len(dates) == 0:
+        return date
+
+    return max(dates)
+
+# Purpose: refreshes the loaded Library names and Library IDs
+# Returns: nothing
+# Assumes: run by tablelib.refresh
+# Effects: adds the Libraries and Library IDs modified since they were
+#          loaded (a renamed Library loses its old name); reloads a
+#          dictionary whose size no longer matches the database (rows
+#          were deleted); empties the Library dictionary if it only holds
+#          the names looked up so far; dictionaries shared by sharedlib
+#          are read-only and are not refreshed
+# Throws: nothing
+
+def refreshLibraries():
+
+    global libraryDict, libraryDate
+
+    with libraryLock:
+        if not libraryLoaded and isinstance(libraryDict, dict):
+            libraryDict = {}
+
+        if libraryLoaded and isinstance(libraryDict, dict):
+            query = 'select _Source_key, name, modification_date from PRB_Source where name is not null'
+            if libraryDate is not None:
+                query = query + ' and modification_date >= \'%s\'' % (libraryDate)
+
+            results = db.sql(query, 'auto')
+
+            keys = set([r['_Source_key'] for r in results])
+            names = set([r['name'] for r in results])
+            for name in [x for x in libraryDict if libraryDict[x] in keys and x not in names]:
+                del libraryDict[name]
+            for r in results:
+                libraryDict[r['name']] = r['_Source_key']
+            libraryDate = maxDate(results, libraryDate)
+
+            results = db.sql('select count(distinct name) as libraries from PRB_Source where name is not null', 'auto')
+            if results[0]['libraries'] != len(libraryDict):
+                results = db.sql('select _Source_key, name, modification_date from PRB_Source where name is not null', 'auto')
+                libraryDict = dict([(r['name'], r['_Source_key']) for r in results])
+                libraryDate = maxDate(results, None)
+
+        logicalDBKeys = [k for k in libraryIDDict if isinstance(libraryIDDict[k], dict)]
+
+        if len(logicalDBKeys) == 0:
+            return
+
+        clauses = []
+        for k in logicalDBKeys:
+            if libraryIDDates.get(k) is None:
+                clauses.append('_LogicalDB_key = %d' % (k))
+            else:
+                clauses.append('(_LogicalDB_key = %d and modification_date >= \'%s\')' % (k, libraryIDDates[k]))
+
+        results = db.sql('select _LogicalDB_key, _Object_key, accID, modification_date from PRB_Source_Acc_View ' + \
+            'where ' + ' or '.join(clauses), 'auto')
+
+        for k in logicalDBKeys:
+            rows = [r for r in results if r['_LogicalDB_key'] == k]
+            for r in rows:
+                libraryIDDict[k][r['accID']] = r['_Object_key']
+            libraryIDDates[k] = maxDate(rows, libraryIDDates.get(k))
+
+        results = db.sql('select _LogicalDB_key, count(distinct accID) as libraryIDs from PRB_Source_Acc_View ' + \
+            'where _LogicalDB_key in (%s) ' % (','.join([str(k) for k in logicalDBKeys])) + \
+            'group by _LogicalDB_key', 'auto')
+
+        counts = {}
+        for r in results:
+            counts[r['_LogicalDB_key']] = r['libraryIDs']
+
+        stale = [k for k in logicalDBKeys if counts.get(k, 0) != len(libraryIDDict[k])]
+
+        if len(stale) > 0:
+            preloadLibraryIDs(stale, reload = 1)
+
 # Purpose: verifies the Gender
 # Returns: 0 if the Gender
 #		else the primary key of the Gender
@@ -171,16 +458,17 @@ def verifyGender(
 
     global genderDict
 
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifyGender, gender, lineNum, errorFile)
+
     if len(genderDict) == 0:
-        results = db.sql('select _Term_key, term from VOC_Term where _Vocab_key = 17', 'auto')
-        for r in results:
-            genderDict[r['term']] = r['_Term_key']
+        tablelib.load('gender')
 
     if gender in genderDict:
         return genderDict[gender]
     else:
         if errorFile != None:
-            errorFile.write('Invalid Gender (line: %d) %s\n' % (lineNum, gender))
+            errorlib.report(errorFile, 'Invalid Gender (line: %d) %s\n', lineNum, gender)
         return 0
 
 # Purpose: verifies the Organism
@@ -199,14 +487,22 @@ def verifyOrganism(
 
     global organismDict
 
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifyOrganism, organism, lineNum, errorFile)
+
     if organism in organismDict:
         return organismDict[organism] 
+    elif organism in organismMisses:
+        if errorFile != None:
+            errorlib.report(errorFile, 'Invalid Organism (line: %d) %s\n', lineNum, organism)
+        return 0
     else:
-        results = db.sql('select _Organism_key from MGI_Organism where commonName = \'%s\'' % (organism), 'auto')
+        results = statementlib.execute('verifyOrganism', organism)
 
         if len(results) == 0:
+            organismMisses.add(organism)
             if errorFile != None:
-                errorFile.write('Invalid Organism (line: %d) %s\n' % (lineNum, organism))
+                errorlib.report(errorFile, 'Invalid Organism (line: %d) %s\n', lineNum, organism)
             return 0
 
         for r in results:
@@ -236,33 +532,170 @@ def verifySource(
 
     global sourceDict
 
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifySource, segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age, lineNum, errorFile)
+
+    if sourceIndexLoaded:
+        key = sourceIndexKey(segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age)
+
+        if key in sourceIndex:
+            return sourceIndex[key]
+        elif key is not None:
+            if errorFile != None:
+                source = "%s,%s,%s,%s,%s,%s,%s,%s" % (segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age)
+                errorlib.report(errorFile, 'Invalid Source (line: %d) %s\n%s\n\n', lineNum, source, \
+                    detail = lambda: (sourceQuery(segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age),))
+            return 0
+
     source = "%s,%s,%s,%s,%s,%s,%s,%s" % (segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age)
 
     if source in sourceDict:
         return sourceDict[source] 
+    elif source in sourceMisses:
+        if errorFile != None:
+            errorlib.report(errorFile, 'Invalid Source (line: %d) %s\n%s\n\n', lineNum, source, \
+                detail = lambda: (sourceQuery(segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age),))
+        return 0
     else:
-        sourceQuery = 'select _Source_key from PRB_Source where ' + \
-                '_SegmentType_key = %s ' % (segmentTypeKey) + \
-                'and _Vector_key = %s ' % (vectorKey) + \
-                'and _Organism_key = %s ' % (organismKey) + \
-                'and _Strain_key = %s ' % (strainKey) + \
-                'and _Tissue_key = %s ' % (tissueKey) + \
-                'and _Gender_key = %s ' % (genderKey) + \
-                'and _CellLine_key = %s ' % (cellLineKey) + \
-                'and age = \'%s\' ' % (age) + \
-                'and isCuratorEdited = 0 '
-
-        results = db.sql(sourceQuery, 'auto')
+        results = statementlib.execute('verifySource', segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age)
 
         if len(results) == 0:
+            sourceMisses.add(source)
             if errorFile != None:
-                errorFile.write('Invalid Source (line: %d) %s\n%s\n\n' % (lineNum, source, sourceQuery))
+                errorlib.report(errorFile, 'Invalid Source (line: %d) %s\n%s\n\n', lineNum, source, \
+                    detail = lambda: (sourceQuery(segmentTypeKey, vectorKey, organismKey, strainKey, tissueKey, genderKey, cellLineKey, age),))
             return 0
 
         for r in results:
             sourceDict[source] = r['_Source_key']
             return r['_Source_key'] 
 
+# Purpose: builds the text of the PRB_Source query of verifySource,
+#          written to the error log with an invalid Source
+# Returns: str.
+# Assumes: nothing
+# Effects: nothing
+# Throws: nothing
+
+def sourceQuery(
+    segmentTypeKey, 
+    vectorKey, 
+    organismKey, 
+    strainKey, 
+    tissueKey, 
+    genderKey, 
+    cellLineKey, 
+    age
+    ):
+
+    return 'select _Source_key from PRB_Source where ' + \
+        '_SegmentType_key = %s ' % (segmentTypeKey) + \
+        'and _Vector_key = %s ' % (vectorKey) + \
+        'and _Organism_key = %s ' % (organismKey) + \
+        'and _Strain_key = %s ' % (strainKey) + \
+        'and _Tissue_key = %s ' % (tissueKey) + \
+        'and _Gender_key = %s ' % (genderKey) + \
+        'and _CellLine_key = %s ' % (cellLineKey) + \
+        'and age = \'%s\' ' % (age) + \
+        'and isCuratorEdited = 0 '
+
+# Purpose: builds the Source index key of a Source
+# Returns: bytes (the seven keys and the age number, packed as 32-bit integers)
+#          b'' if the age does not occur in the index
+#          None if a key is not an integer, in which case the index cannot be used
+# Assumes: nothing
+# Effects: nothing
+# Throws: nothing
+
+def sourceIndexKey(
+    segmentTypeKey, 
+    vectorKey, 
+    organismKey, 
+    strainKey, 
+    tissueKey, 
+    genderKey, 
+    cellLineKey, 
+    age
+    ):
+
+    if age not in sourceAges:
+        return b''
+
+    try:
+        return sourceKeyFormat.pack(int(segmentTypeKey), int(vectorKey), int(organismKey), int(strainKey), \
+            int(tissueKey), int(genderKey), int(cellLineKey), sourceAges[age])
+    except (TypeError, ValueError, struct.error):
+        return None
+
+# Purpose: preloads the Source index used by verifySource
+# Returns: nothing
+# Assumes: nothing
+# Effects: indexes every non-curator-edited PRB_Source row in one query;
+#          verifySource then answers from memory and reports any
+#          combination not in the index
+#          each row is keyed by its seven keys and the number of its age,
+#          packed into 32 bytes, which keeps the index small
+#          when called again (see refreshSources), builds a new index and
+#          swaps it in; an age keeps its number, so a reader that sees the
+#          new ages with the old index still finds the old rows
+# Throws: nothing
+
+def preloadSources():
+
+    global sourceIndex, sourceAges, sourceIndexLoaded, sourceVersion
+
+    version = sourceSignature()
+    index = {}
+    ages = dict(sourceAges)
+
+    results = db.sql('select _Source_key, _SegmentType_key, _Vector_key, _Organism_key, ' + \
+        '_Strain_key, _Tissue_key, _Gender_key, _CellLine_key, age ' + \
+        'from PRB_Source ' + \
+        'where isCuratorEdited = 0 ' + \
+        'order by _Source_key', 'auto')
+
+    for r in results:
+        try:
+            key = sourceKeyFormat.pack(r['_SegmentType_key'], r['_Vector_key'], r['_Organism_key'], \
+                r['_Strain_key'], r['_Tissue_key'], r['_Gender_key'], r['_CellLine_key'], \
+                ages.setdefault(r['age'], len(ages)))
+        except struct.error:
+            continue
+
+        if key not in index:
+            index[key] = r['_Source_key']
+
+    sourceAges = ages
+    sourceIndex = index
+    sourceVersion = version
+    sourceIndexLoaded = 1
+
+# Purpose: reads the signature of the PRB_Source rows of the Source index
+# Returns: (row count, max modification date as str.)
+# Assumes: nothing
+# Effects: queries the database
+# Throws: nothing
+
+def sourceSignature():
+
+    results = db.sql('select count(*) as rowCount, max(modification_date) as maxDate ' + \
+        'from PRB_Source ' + \
+        'where isCuratorEdited = 0', 'auto')
+
+    return (results[0]['rowCount'], str(results[0]['maxDate']))
+
+# Purpose: refreshes the Source index
+# Returns: nothing
+# Assumes: run by tablelib.refresh
+# Effects: loads the Source index again if it has been loaded and the
+#          row count or max modification date of its rows has changed
+# Throws: nothing
+
+def refreshSources():
+
+    if sourceIndexLoaded and sourceSignature() != sourceVersion:
+        preloadSources()
+
 # Purpose: verifies the Strain returning the Strain Key
 # Returns: 0 if the Strain
 #		else the primary key of the Strain
@@ -279,16 +712,22 @@ def verifyStrain(
 
     global strainDict
 
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifyStrain, strain, lineNum, errorFile)
+
     if strain in strainDict:
         return strainDict[strain] 
+    elif strain in strainMisses:
+        if errorFile != None:
+            errorlib.report(errorFile, 'Invalid Strain (line: %d) %s\n', lineNum, strain)
+        return 0
     else:
-        results = db.sql('select s._Strain_key ' + \
-            'from PRB_Strain s ' + \
-            'where s.strain = \'%s\' ' % (strain), 'auto')
+        results = statementlib.execute('verifyStrain', strain)
 
         if len(results) == 0:
+            strainMisses.add(strain)
             if errorFile != None:
-                errorFile.write('Invalid Strain (line: %d) %s\n' % (lineNum, strain))
+                errorlib.report(errorFile, 'Invalid Strain (line: %d) %s\n', lineNum, strain)
             return 0
 
         for r in results:
@@ -311,16 +750,17 @@ def verifyTissue(
 
     global tissueDict
 
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifyTissue, tissue, lineNum, errorFile)
+
     if len(tissueDict) == 0:
-        results = db.sql('select _Tissue_key, tissue from PRB_Tissue ', 'auto')
-        for r in results:
-            tissueDict[r['tissue']] = r['_Tissue_key']
+        tablelib.load('tissue')
 
     if tissue in tissueDict:
         return tissueDict[tissue]
     else:
         if errorFile != None:
-            errorFile.write('Invalid Tissue (line: %d) %s\n' % (lineNum, tissue))
+            errorlib.report(errorFile, 'Invalid Tissue (line: %d) %s\n', lineNum, tissue)
         return 0
 
 # Purpose: verifies the Segment Type
@@ -339,16 +779,17 @@ def verifySegmentType(
 
     global segmentTypeDict
 
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifySegmentType, segmentType, lineNum, errorFile)
+
     if len(segmentTypeDict) == 0:
-        results = db.sql('select _Term_key, term from VOC_Term where _Vocab_key = 10', 'auto')
-        for r in results:
-            segmentTypeDict[r['term']] = r['_Term_key']
+        tablelib.load('segmentType')
 
     if segmentType in segmentTypeDict:
         return segmentTypeDict[segmentType]
     else:
         if errorFile != None:
-            errorFile.write('Invalid SegmentType (line: %d) %s\n' % (lineNum, segmentType))
+            errorlib.report(errorFile, 'Invalid SegmentType (line: %d) %s\n', lineNum, segmentType)
         return 0
 
 # Purpose: verifies the Vector Type
@@ -367,14 +808,66 @@ def verifyVectorType(
 
     global vectorTypeDict
 
+    if loadlib.deferred.mode:
+        return loadlib.deferVerify(verifyVectorType, vectorType, lineNum, errorFile)
+
     if len(vectorTypeDict) == 0:
-        results = db.sql('select _Term_key, term from VOC_Term where _Vocab_key = 24', 'auto')
-        for r in results:
-            vectorTypeDict[r['term']] = r['_Term_key']
+        tablelib.load('vectorType')
 
     if vectorType in vectorTypeDict:
         return vectorTypeDict[vectorType]
     else:
         if errorFile != None:
-            errorFile.write('Invalid VectorType (line: %d) %s\n' % (lineNum, vectorType))
+            errorlib.report(errorFile, 'Invalid VectorType (line: %d) %s\n', lineNum, vectorType)
         return 0
+
+# Purpose: prefetch Strains
+# Returns: nothing
+# Assumes: nothing
+# Effects: adds the name and key of every valid Strain in strainList to the
+#          Strain dictionary using one query per chunk of names
+# Throws: nothing
+
+def prefetchStrains(
+    strainList		# list of Strain values (list of str.
+    ):
+
+    global strainDict
+
+    nameList = [x for x in dict.fromkeys(strainList) \
+        if x not in strainDict and not strainMisses.has(x)]
+
+    for chunk in loadlib.chunkList(nameList):
+        results = db.sql('select s.strain, s._Strain_key ' + \
+            'from PRB_Strain s ' + \
+            'where s.strain in (%s) ' % (loadlib.sqlList(chunk)), 'auto')
+
+        found = set()
+        for r in results:
+            if r['strain'] not in found:
+                strainDict[r['strain']] = r['_Strain_key']
+                found.add(r['strain'])
+
+        for strain in chunk:
+            if strain not in found:
+                strainMisses.add(strain)
+
+# batch resolver used by loadlib.resolveDeferred
+
+def batchStrains(pending):
+    prefetchStrains([d.args[0] for d in pending])
+
+def batchLibraries(pending):
+    # without declared names, verifyLibrary loads every Library anyway
+    if not libraryDeclared:
+        preloadLibraries()
+    else:
+        prefetchLibraries([d.args[0] for d in pending])
+
+loadlib.batchResolvers['verifyLibrary'] = batchLibraries
+loadlib.batchResolvers['verifyStrain'] = batchStrains
+
+tablelib.refreshers.append(refreshLibraries)
+tablelib.refreshers.append(refreshSources)
+
+statslib.register(__name__)
@@ -0,0 +1,242 @@
+#
+# Program: statementlib.py
+#
+# Purpose:
+#
+#	Provide the prepared statements used by the verify* functions of
+#	the data load libraries (loadlib, sourceloadlib, alleleloadlib)
+#	for their per-value database lookups.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	Each library registers its statements when it is imported, with
+#	the parameters written $1, $2, ...:
+#
+#	statementlib.register('verifyUser',
+#		'select _User_key from MGI_User where login = $1')
+#
+#	and its verify* function executes them:
+#
+#	results = statementlib.execute('verifyUser', userID)
+#
+#	The statements are run as plain SQL unless the load turns the
+#	prepared statements on, after keeping its connection:
+#
+#	db.useOneConnection(1)
+#	statementlib.setPrepare(1)
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+# Exit Codes:
+#
+# Assumes:
+#
+#	with setPrepare(1), each thread keeps its connection from one
+#	db.sql() call to the next (db.useOneConnection(1))
+#
+# Bugs:
+#
+#	db.sql() takes SQL text only, so the parameter values are still
+#	sent as (quoted) literals of the EXECUTE
+#
+# Implementation:
+#
+#	The first execute() of a statement sends a PREPARE for it; the
+#	server parses and plans the query once, and each later execute()
+#	sends only "execute name(values)".
+#	Postgres keeps prepared statements per connection, so the set of
+#	prepared statements is kept per thread.  If the connection has
+#	lost a statement (a new connection), it is prepared again once;
+#	if that fails too, or the server cannot prepare at all, the
+#	prepared statements are turned off and every statement is run
+#	as plain SQL, with the values substituted.
+#	In both cases each value is quoted, so a value that contains a
+#	quote (e.g. a strain name) cannot break the query.
+#
+
+import sys
+import os
+import re
+import threading
+import db
+
+#globals
+
+statements = {}		# statement name : Statement
+usePrepared = 0		# 1 = PREPARE/EXECUTE, 0 = plain SQL (see setPrepare)
+lock = threading.Lock()	# held while a statement is prepared
+
+parameter = re.compile(r'\$(\d+)')
+
+# Purpose:  the statements prepared on the connection of one thread
+
+class PreparedSet(threading.local):
+
+    def __init__(self):
+        self.names = set()
+
+prepared = PreparedSet()
+
+# Purpose:  a registered statement
+
+class Statement:
+
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        self.serverName = 'dataload_%s' % (name.lower())
+
+    def prepareQuery(self):
+        return 'prepare %s as %s' % (self.serverName, self.text)
+
+    def executeQuery(self, values):
+        if len(values) == 0:
+            return 'execute %s' % (self.serverName)
+        return 'execute %s(%s)' % (self.serverName, ','.join([quote(x) for x in values]))
+
+    def query(self, values):
+        return parameter.sub(lambda m: quote(values[int(m.group(1)) - 1]), self.text)
+
+# Purpose:  registers a statement
+# Returns:  nothing
+# Assumes:  the parameters of the statement are written $1, $2, ...
+# Effects:  adds the statement to the registry
+# Throws:  nothing
+
+def register(
+    name,	# statement name used by execute() (str.
+    text	# SQL (str.
+    ):
+
+    statements[name] = Statement(name, text)
+
+# Purpose:  turns the use of prepared statements on or off
+# Returns:  nothing
+# Assumes:  with 1, db.useOneConnection(1) (see Assumes above)
+# Effects:  later statements are prepared (1) or run as plain SQL (0)
+# Throws:  nothing
+
+def setPrepare(
+    value	# 1 or 0 (integer)
+    ):
+
+    global usePrepared
+
+    with lock:
+        usePrepared = value
+        prepared.names.clear()
+
+# Purpose:  quotes a value as an SQL literal
+# Returns:  str.
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def quote(
+    value	# the value (str., integer or None)
+    ):
+
+    if value is None:
+        return 'null'
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+
+    return '\'%s\'' % (str.replace(str(value), '\'', '\'\''))
+
+# Purpose:  prepares a statement on the connection of the calling thread
+# Returns:  1 if the statement is prepared, else 0
+# Assumes:  nothing
+# Effects:  sends the PREPARE; turns the prepared statements off if
+#	the server cannot prepare
+# Throws:  nothing
+
+def prepare(
+    s		# the statement (Statement)
+    ):
+
+    global usePrepared
+
+    with lock:
+        if s.name in prepared.names:
+            return 1
+
+        if not usePrepared:
+            return 0
+
+        try:
+            db.sql(s.prepareQuery(), None)
+        except Exception as e:
+            if str(e).find('already exists') < 0:
+                usePrepared = 0
+                return 0
+
+        prepared.names.add(s.name)
+        return 1
+
+# Purpose:  tells whether an error says the connection does not have
+#	the statement (SQLSTATE 26000, invalid_sql_statement_name)
+# Returns:  1 if it does, else 0
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def isMissing(
+    s,		# the statement (Statement)
+    e		# the exception raised by db.sql
+    ):
+
+    if getattr(e, 'pgcode', None) == '26000':
+        return 1
+
+    if str(e).find('prepared statement "%s" does not exist' % (s.serverName)) >= 0:
+        return 1
+
+    return 0
+
+# Purpose:  executes a registered statement
+# Returns:  list of dictionaries (one per row), as db.sql does
+# Assumes:  the statement is registered
+# Effects:  queries the database; prepares the statement on first use
+# Throws:  the exceptions of db.sql
+#	KeyError if the statement is not registered
+
+def execute(
+    name,	# statement name (str.
+    *values	# the parameter values, for $1, $2, ...
+    ):
+
+    global usePrepared
+
+    s = statements[name]
+
+    if not usePrepared or (s.name not in prepared.names and not prepare(s)):
+        return db.sql(s.query(values), 'auto')
+
+    try:
+        return db.sql(s.executeQuery(values), 'auto')
+    except Exception as e:
+        if not isMissing(s, e):
+            raise
+
+    # a new connection does not have the statement: prepare it again
+    prepared.names.discard(s.name)
+
+    if prepare(s):
+        try:
+            return db.sql(s.executeQuery(values), 'auto')
+        except Exception as e:
+            if not isMissing(s, e):
+                raise
+
+    # the connection is not kept from one call to the next
+    with lock:
+        usePrepared = 0
+
+    return db.sql(s.query(values), 'auto')
@@ -0,0 +1,364 @@
+#
+# Program: statslib.py
+#
+# Purpose:
+#
+#	Provide performance instrumentation for the verify* (and prefetch*)
+#	functions of the data load libraries (loadlib, sourceloadlib,
+#	alleleloadlib).
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	statslib.enable()
+#	... load ...
+#	statslib.writeReport(sys.stderr)
+#
+#	or set DATALOAD_STATS to have the report written at exit.
+#
+#	Call enable() before binding verifiers with "from loadlib import ...";
+#	calls through the module (loadlib.verifyMarker) are always counted.
+#
+# Envvars:
+#
+#	DATALOAD_STATS		if set, instrumentation is enabled on import
+#				and the report is written at exit, to stderr
+#				('1') or to the file it names
+#
+# Inputs:
+#
+# Outputs:
+#
+#	the report (see writeReport)
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#	Each library calls statslib.register(__name__) at the end of the module.
+#	enable() replaces every verify* and prefetch* function of the
+#	registered modules, and db.sql, by a timing wrapper; disable()
+#	restores them, so there is no cost while instrumentation is off.
+#	Each db.sql call is charged to the innermost running function.
+#	A call that issues no db.sql is a cache hit, any other call a miss.
+#	In deferred mode (see loadlib.setDeferred) a verifier first returns
+#	a DeferredKey; that call is not counted, only the call made when
+#	resolveDeferred resolves it.  The batch SQL of resolveDeferred is
+#	charged to the prefetch* functions, so a deferred verifier is
+#	mostly hits, and the report says so.
+#
+
+import sys
+import os
+import time
+import atexit
+import functools
+import threading
+import cachelib
+import db
+
+#globals
+
+enabled = 0
+modules = []		# names of the registered modules
+originals = {}		# (module name, function name) : original function
+sqlFunction = None	# the original db.sql while enabled
+
+stats = {}		# function name : Stats
+running = threading.local()	# per-thread stack of the running functions' Stats
+lock = threading.Lock()		# held while the counters are updated
+
+# Purpose:  counters for one instrumented function
+
+class Stats:
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.hits = 0		# calls that issued no db.sql
+        self.misses = 0		# calls that issued at least one db.sql
+        self.sqlCalls = 0
+        self.sqlTime = 0.0	# seconds spent in db.sql
+        self.totalTime = 0.0	# seconds spent in the function, including db.sql
+
+    def pythonTime(self):
+        if self.calls == 0:
+            return 0.0
+        return self.totalTime - self.sqlTime
+
+    def asDict(self):
+        return {'calls' : self.calls, 'hits' : self.hits, 'misses' : self.misses,
+            'sqlCalls' : self.sqlCalls, 'sqlTime' : self.sqlTime,
+            'pythonTime' : self.pythonTime(), 'totalTime' : self.totalTime}
+
+other = Stats('(outside verifiers)')	# db.sql calls made outside any instrumented function
+
+# Purpose:  returns the stack of running instrumented functions of this thread
+# Returns:  list of Stats
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def stack():
+
+    if not hasattr(running, 'stack'):
+        running.stack = []
+
+    return running.stack
+
+# Purpose:  wraps a verify*/prefetch* function
+# Returns:  the wrapper
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def instrument(
+    name,	# name used in the report, e.g. 'loadlib.verifyMarker' (str.
+    function	# the function
+    ):
+
+    if name not in stats:
+        stats[name] = Stats(name)
+    s = stats[name]
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        calls = stack()
+        calls.append(s)
+        sqlCalls = s.sqlCalls
+        start = time.perf_counter()
+        result = None
+        try:
+            result = function(*args, **kwargs)
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            calls.pop()
+            if not isDeferred(result):
+                count(s, sqlCalls, elapsed)
+
+    return wrapper
+
+# Purpose:  tells whether a verifier call only recorded a deferred lookup
+# Returns:  1 if the result is a loadlib.DeferredKey, else 0
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def isDeferred(
+    result	# the result of the call
+    ):
+
+    loadlib = sys.modules.get('loadlib')
+
+    if loadlib is None or not hasattr(loadlib, 'DeferredKey'):
+        return 0
+
+    return isinstance(result, loadlib.DeferredKey)
+
+# Purpose:  counts one call of an instrumented function
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  updates the counters of the function
+# Throws:  nothing
+
+def count(
+    s,		# the function's counters (Stats)
+    sqlCalls,	# s.sqlCalls when the call started (integer)
+    elapsed	# seconds spent in the call (float)
+    ):
+
+    with lock:
+        s.totalTime = s.totalTime + elapsed
+        s.calls = s.calls + 1
+        if s.sqlCalls == sqlCalls:
+            s.hits = s.hits + 1
+        else:
+            s.misses = s.misses + 1
+
+# Purpose:  timing replacement for db.sql
+# Returns:  the result of db.sql
+# Assumes:  nothing
+# Effects:  charges the call to the innermost running instrumented function
+# Throws:  whatever db.sql throws
+
+def sql(*args, **kwargs):
+
+    start = time.perf_counter()
+    try:
+        return sqlFunction(*args, **kwargs)
+    finally:
+        calls = stack()
+        if len(calls) > 0:
+            s = calls[-1]
+        else:
+            s = other
+        elapsed = time.perf_counter() - start
+        with lock:
+            s.sqlCalls = s.sqlCalls + 1
+            s.sqlTime = s.sqlTime + elapsed
+
+# Purpose:  wraps the verify*/prefetch* functions of a module
+# Returns:  nothing
+# Assumes:  the module has been imported
+# Effects:  replaces the module's functions by their wrappers
+# Throws:  nothing
+
+def instrumentModule(
+    module	# module name (str.
+    ):
+
+    m = sys.modules[module]
+
+    for attr in list(vars(m)):
+        if not (attr.startswith('verify') or attr.startswith('prefetch')):
+            continue
+        function = getattr(m, attr)
+        if not callable(function) or (module, attr) in originals:
+            continue
+        originals[(module, attr)] = function
+        setattr(m, attr, instrument('%s.%s' % (module, attr), function))
+
+# Purpose:  registers a library for instrumentation
+# Returns:  nothing
+# Assumes:  called at the end of the library module
+# Effects:  instruments the module now if instrumentation is enabled
+# Throws:  nothing
+
+def register(
+    module	# module name (str.
+    ):
+
+    if module not in modules:
+        modules.append(module)
+
+    if enabled:
+        instrumentModule(module)
+
+# Purpose:  turns instrumentation on
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  wraps db.sql and the functions of every registered module
+# Throws:  nothing
+
+def enable():
+
+    global enabled, sqlFunction
+
+    if enabled:
+        return
+
+    enabled = 1
+    sqlFunction = db.sql
+    db.sql = sql
+
+    for module in modules:
+        instrumentModule(module)
+
+# Purpose:  turns instrumentation off
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  restores db.sql and the original functions; keeps the counters
+# Throws:  nothing
+
+def disable():
+
+    global enabled, sqlFunction
+
+    if not enabled:
+        return
+
+    enabled = 0
+    db.sql = sqlFunction
+    sqlFunction = None
+
+    for (module, attr), function in originals.items():
+        setattr(sys.modules[module], attr, function)
+    originals.clear()
+
+# Purpose:  clears the counters
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def reset():
+
+    for s in list(stats.values()) + [other]:
+        s.__init__(s.name)
+
+# Purpose:  returns the counters
+# Returns:  dictionary of function name : dictionary of counters
+#	(calls, hits, misses, sqlCalls, sqlTime, pythonTime, totalTime)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def getStats():
+
+    results = {}
+
+    for s in list(stats.values()) + [other]:
+        if s.calls > 0 or s.sqlCalls > 0:
+            results[s.name] = s.asDict()
+
+    return results
+
+# Purpose:  writes the report
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  writes one line per function that was called, slowest first,
+#	followed by the miss cache summary
+# Throws:  nothing
+
+def writeReport(
+    fp		# output file (file descriptor)
+    ):
+
+    results = getStats()
+
+    fp.write('%-40s %10s %8s %8s %8s %10s %10s\n' \
+        % ('function', 'calls', 'hit %', 'misses', 'sql', 'sql sec', 'py sec'))
+
+    for name in sorted(results, key = lambda x: -results[x]['totalTime']):
+        r = results[name]
+        if r['calls'] > 0:
+            hitRatio = 100.0 * r['hits'] / r['calls']
+        else:
+            hitRatio = 0.0
+        fp.write('%-40s %10d %8.1f %8d %8d %10.3f %10.3f\n' \
+            % (name, r['calls'], hitRatio, r['misses'], r['sqlCalls'], r['sqlTime'], r['pythonTime']))
+
+    if len([x for x in results if x.split('.')[-1].startswith('prefetch')]) > 0:
+        fp.write('(the batch SQL of deferred and prefetched lookups is charged to prefetch*;\n' + \
+            ' the verify* calls answered from it count as hits)\n')
+
+    cachelib.writeMissSummary(fp)
+
+# Purpose:  writes the report at exit
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  writes the report to stderr, or to the file named by 'output'
+# Throws:  nothing
+
+def writeAtExit(
+    output = '1'	# '1' = stderr, else a file name (str.
+    ):
+
+    def report():
+        if output == '1':
+            writeReport(sys.stderr)
+        else:
+            with open(output, 'w') as fp:
+                writeReport(fp)
+
+    atexit.register(report)
+
+if os.environ.get('DATALOAD_STATS', '') != '':
+    enable()
+    writeAtExit(os.environ['DATALOAD_STATS'])
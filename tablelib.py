@@ -0,0 +1,540 @@
+#
+# Program: tablelib.py
+#
+# Purpose:
+#
+#	Provide the small controlled-vocabulary lookup tables (value : key)
+#	used by the data load libraries (loadlib, sourceloadlib), and an
+#	on-disk snapshot of them for fast startup.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#	Each library registers its lookup tables when it is imported:
+#
+#	tablelib.register('logicalDB', __name__, 'logicalDBDict',
+#		'ACC_LogicalDB', 'name', '_LogicalDB_key')
+#
+#	and its verify* function calls tablelib.load('logicalDB') the first
+#	time the dictionary is empty.
+#
+#	A load can instead fill every registered table up front, in one
+#	round trip, before its first row:
+#
+#	tablelib.warmup()
+#
+#	A resident process keeps the tables (and the other preloaded
+#	dictionaries, see refreshers) current with:
+#
+#	tablelib.refresh()		on demand, or
+#	tablelib.startRefresh(300)	every 5 minutes, in a thread
+#
+# Envvars:
+#
+#	DATALOAD_SNAPSHOT	full path of the snapshot file (optional)
+#	PG_DBSERVER, PG_DBNAME	stored in the snapshot to tie it to a database
+#
+# Inputs:
+#
+#	the snapshot file, if DATALOAD_SNAPSHOT is set
+#
+# Outputs:
+#
+#	the snapshot file, if DATALOAD_SNAPSHOT is set and the snapshot
+#	is missing or out of date
+#
+# Exit Codes:
+#
+# Assumes:
+#
+#	every registered table has a modification_date column
+#
+# Bugs:
+#
+# Implementation:
+#
+#	The snapshot is read when this module is imported.  It is a JSON
+#	file, not a pickle, so a snapshot written by someone else can only
+#	hold table rows, never code; each table is a list of [key, value].
+#	The first load() of a table reads the signature (row count, max key,
+#	max modification date) of every registered table that has not been
+#	loaded yet, in one query.  Each table whose signature matches the
+#	snapshot is filled from the snapshot; the others are loaded from the
+#	database and the snapshot is rewritten.
+#	Without DATALOAD_SNAPSHOT, load() simply queries the one table.
+#
+#	Tables are fetched together with one "union all" query of
+#	(table name, key, value) rows; the key and the value each take
+#	one of two columns, text or integer, so that the column types
+#	agree across the tables.  A column named _x_key is an integer.
+#
+#	Each table keeps the version (row count, max modification date)
+#	of the rows it was filled from.  refresh() reads the versions of
+#	all the filled tables in one query and reloads, in one more query,
+#	only the tables that changed; then it runs the refreshers, which
+#	pull the changed rows of the larger dictionaries of the libraries,
+#	load again each preloaded index (sourceloadlib.preloadSources,
+#	loadlib.preloadMarkers, preloadVocab and preloadObjects) whose
+#	signature has changed, and empty the miss caches (see cachelib),
+#	so the invalid IDs are looked up again.
+#	The per-ID caches of valid IDs are kept: the key of an ID does not
+#	change, and emptying them would reload them on every refresh.  An
+#	object deleted or merged in the database stays in them until
+#	cachelib.clearCaches() is called.
+#
+#	load() holds a lock, so when several threads find a table empty
+#	only the first one loads it.  fill() never empties a dictionary
+#	that is being read: it adds the new rows, then removes the old ones.
+#
+
+import sys
+import os
+import json
+import tempfile
+import threading
+import db
+
+#globals
+
+SNAPSHOT_VERSION = 2	# incremented whenever the snapshot format changes
+
+snapshotFile = os.environ.get('DATALOAD_SNAPSHOT', '')
+snapshot = None		# contents of the snapshot file (dictionary) or None
+
+tables = {}		# table name : LookupTable, in registration order
+checked = set()		# names of tables already checked against the snapshot
+filled = set()		# names of tables filled by load()
+versions = {}		# table name : (row count, max modification date) of its rows
+refreshers = []		# functions run by refresh() after the tables
+refreshThread = None	# thread started by startRefresh()
+refreshStop = threading.Event()	# set to stop refreshThread
+lock = threading.RLock()	# held while a table is loaded
+
+# Purpose:  a registered lookup table
+#	the dictionary is the global 'attr' of module 'module',
+#	filled with keyColumn : valueColumn for the rows of 'table'
+
+class LookupTable:
+
+    def __init__(self, name, module, attr, table, keyColumn, valueColumn, where = '', shared = 1):
+        self.name = name
+        self.module = module
+        self.attr = attr
+        self.table = table
+        self.keyColumn = keyColumn
+        self.valueColumn = valueColumn
+        self.where = where
+        self.shared = shared
+
+    def dictionary(self):
+        return getattr(sys.modules[self.module], self.attr)
+
+    def query(self):
+        return 'select %s, %s, modification_date from %s %s' % (self.valueColumn, self.keyColumn, self.table, self.where)
+
+    def batchQuery(self):
+        return 'select \'%s\' as name, %s, %s, modification_date from %s %s' \
+            % (self.name, batchColumns(self.keyColumn, 'key'), batchColumns(self.valueColumn, 'value'), \
+            self.table, self.where)
+
+    def signatureQuery(self):
+        return 'select \'%s\' as name, count(*) as rowCount, ' % (self.name) + \
+            'cast(max(%s) as text) as maxKey, max(modification_date) as maxDate ' % (self.valueColumn) + \
+            'from %s %s' % (self.table, self.where)
+
+    def fill(self, rows):
+        d = self.dictionary()
+        d.update(rows)
+        for key in [x for x in d if x not in rows]:
+            del d[key]
+
+# Purpose:  registers a lookup table
+# Returns:  nothing
+# Assumes:  the module global 'attr' is a dictionary
+# Effects:  adds the table to the registry
+# Throws:  nothing
+
+def register(
+    name,		# table name used by load() (str.
+    module,		# name of the module that owns the dictionary (str.
+    attr,		# name of the dictionary in that module (str.
+    table,		# database table (str.
+    keyColumn,		# column used as the dictionary key (str.
+    valueColumn,	# column used as the dictionary value (str.
+    where = '',		# optional where clause (str.
+    shared = 1		# 0 = not shared between processes (see sharedlib)
+    ):
+
+    tables[name] = LookupTable(name, module, attr, table, keyColumn, valueColumn, where, shared)
+
+# Purpose:  builds the two columns of a key or value in batchQuery
+# Returns:  str.
+# Assumes:  a column named _x_key is an integer, any other is text
+# Effects:  nothing
+# Throws:  nothing
+
+def batchColumns(
+    column,	# column name (str.
+    prefix	# 'key' or 'value' (str.
+    ):
+
+    if column.startswith('_') and column.endswith('_key'):
+        return 'cast(null as text) as %sText, %s as %sInt' % (prefix, column, prefix)
+
+    return '%s as %sText, cast(null as int) as %sInt' % (column, prefix, prefix)
+
+# Purpose:  returns the version of a table's rows
+# Returns:  (row count, max modification date as str.), as in signatureQuery
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def version(
+    results	# the rows of the table (list of dictionaries)
+    ):
+
+    dates = [r['modification_date'] for r in results if r['modification_date'] is not None]
+
+    if len(dates) == 0:
+        return (len(results), str(None))
+
+    return (len(results), str(max(dates)))
+
+# Purpose:  loads a lookup table from the database
+# Returns:  dictionary of keyColumn : valueColumn
+# Assumes:  nothing
+# Effects:  queries the database; records the version of the rows
+# Throws:  nothing
+
+def fetch(
+    name	# table name (str.
+    ):
+
+    t = tables[name]
+    rows = {}
+
+    results = db.sql(t.query(), 'auto')
+    for r in results:
+        rows[r[t.keyColumn]] = r[t.valueColumn]
+
+    versions[name] = version(results)
+
+    return rows
+
+# Purpose:  loads several lookup tables from the database
+# Returns:  dictionary of table name : dictionary of keyColumn : valueColumn
+# Assumes:  nothing
+# Effects:  queries the database once; records the version of the rows
+# Throws:  nothing
+
+def fetchAll(
+    names	# table names (list)
+    ):
+
+    rows = {}
+    tableResults = {}
+
+    if len(names) == 0:
+        return rows
+
+    for x in names:
+        rows[x] = {}
+        tableResults[x] = []
+
+    results = db.sql(' union all '.join([tables[x].batchQuery() for x in names]), 'auto')
+    for r in results:
+        key = r['keyText']
+        if key is None:
+            key = r['keyInt']
+        value = r['valueText']
+        if value is None:
+            value = r['valueInt']
+        rows[r['name']][key] = value
+        tableResults[r['name']].append(r)
+
+    for x in names:
+        versions[x] = version(tableResults[x])
+
+    return rows
+
+# Purpose:  fills a registered lookup table
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  fills the dictionary of the table from the snapshot,
+#	or from the database (see Implementation),
+#	unless another thread filled it while this one waited for the lock
+# Throws:  nothing
+
+def load(
+    name	# table name (str.
+    ):
+
+    with lock:
+        if name in filled and len(tables[name].dictionary()) > 0:
+            return
+
+        # tables shared by sharedlib are read-only
+        if not isinstance(tables[name].dictionary(), dict):
+            return
+
+        if len(snapshotFile) == 0 or name in checked:
+            tables[name].fill(fetch(name))
+            filled.add(name)
+            return
+
+        names = [x for x in tables if x not in checked and isinstance(tables[x].dictionary(), dict)]
+        checked.update(names)
+
+        results = db.sql(' union all '.join([tables[x].signatureQuery() for x in names]), 'auto')
+
+        signatures = {}
+        for r in results:
+            signatures[r['name']] = (r['rowCount'], str(r['maxKey']), str(r['maxDate']))
+
+        stale = []
+        for x in names:
+            if snapshotMatches(x, signatures[x]):
+                tables[x].fill(snapshot['tables'][x])
+                versions[x] = (signatures[x][0], signatures[x][2])
+            else:
+                stale.append(x)
+
+        rows = fetchAll(stale)
+        for x in stale:
+            tables[x].fill(rows[x])
+
+        filled.update(names)
+
+        if len(stale) > 0:
+            writeSnapshot(stale, signatures)
+
+# Purpose:  fills every registered lookup table
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  fills, in one round trip, each table that is not filled yet
+#	(with DATALOAD_SNAPSHOT, one more round trip reads the signatures)
+# Throws:  nothing
+
+def warmup(
+    names = None	# table names; None = every registered table (list)
+    ):
+
+    with lock:
+        if names is None:
+            names = list(tables)
+
+        # tables shared by sharedlib are read-only
+        names = [x for x in names if isinstance(tables[x].dictionary(), dict)]
+        names = [x for x in names if x not in filled or len(tables[x].dictionary()) == 0]
+
+        if len(names) == 0:
+            return
+
+        # the snapshot check fills the tables it has not checked yet (see load)
+        if len(snapshotFile) > 0 and len([x for x in names if x not in checked]) > 0:
+            load([x for x in names if x not in checked][0])
+            names = [x for x in names if x not in filled or len(tables[x].dictionary()) == 0]
+
+        rows = fetchAll(names)
+        for x in names:
+            tables[x].fill(rows[x])
+
+        filled.update(names)
+
+# Purpose:  refreshes the filled lookup tables and the other preloaded
+#	dictionaries of the libraries
+# Returns:  list of the names of the tables reloaded
+# Assumes:  nothing
+# Effects:  reloads each filled table whose row count or max
+#	modification date has changed since it was filled (see
+#	Implementation), then runs each function in refreshers
+# Throws:  nothing
+
+def refresh():
+
+    with lock:
+        names = [x for x in tables if x in filled]
+        changed = []
+
+        if len(names) > 0:
+            results = db.sql(' union all '.join([tables[x].signatureQuery() for x in names]), 'auto')
+
+            signatures = {}
+            for r in results:
+                signatures[r['name']] = (r['rowCount'], str(r['maxKey']), str(r['maxDate']))
+                if versions.get(r['name']) != (r['rowCount'], str(r['maxDate'])):
+                    changed.append(r['name'])
+
+            # tables shared by sharedlib are read-only
+            changed = [x for x in changed if isinstance(tables[x].dictionary(), dict)]
+
+            rows = fetchAll(changed)
+            for x in changed:
+                tables[x].fill(rows[x])
+
+            if len(snapshotFile) > 0 and len(changed) > 0:
+                writeSnapshot(changed, signatures)
+
+    for f in refreshers:
+        f()
+
+    return changed
+
+# Purpose:  refreshes the lookup tables at a fixed interval
+# Returns:  nothing
+# Assumes:  the db module may be used by this thread and the load
+#	at the same time
+# Effects:  starts a daemon thread that runs refresh() every 'seconds'
+#	seconds until stopRefresh(); a refresh that fails is reported
+#	on stderr and tried again at the next interval
+# Throws:  nothing
+
+def startRefresh(
+    seconds	# interval (float)
+    ):
+
+    global refreshThread
+
+    stopRefresh()
+    refreshStop.clear()
+
+    refreshThread = threading.Thread(target = refreshLoop, args = (seconds,), daemon = True)
+    refreshThread.start()
+
+def refreshLoop(seconds):
+    while not refreshStop.wait(seconds):
+        try:
+            refresh()
+        except Exception as e:
+            sys.stderr.write('tablelib.refresh failed: %s\n' % (str(e)))
+
+# Purpose:  stops the thread started by startRefresh
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  waits for a refresh in progress to finish
+# Throws:  nothing
+
+def stopRefresh():
+
+    global refreshThread
+
+    if refreshThread is not None:
+        refreshStop.set()
+        refreshThread.join()
+        refreshThread = None
+
+# Purpose:  checks a table signature against the snapshot
+# Returns:  1 if the snapshot copy of the table is current, else 0
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def snapshotMatches(
+    name,	# table name (str.
+    signature	# (row count, max key, max modification date)
+    ):
+
+    if snapshot is None or name not in snapshot['tables']:
+        return 0
+
+    return snapshot['signatures'][name] == signature
+
+# Purpose:  identifies the database the snapshot belongs to
+# Returns:  tuple
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  nothing
+
+def database():
+
+    return (os.environ.get('PG_DBSERVER', ''), os.environ.get('PG_DBNAME', ''))
+
+# Purpose:  reads the snapshot file
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  sets snapshot; a missing, unreadable, old-version or
+#	other-database snapshot is ignored
+# Throws:  nothing
+
+def readSnapshot():
+
+    global snapshot
+
+    snapshot = None
+
+    if len(snapshotFile) == 0 or not os.path.exists(snapshotFile):
+        return
+
+    try:
+        with open(snapshotFile, 'r') as fp:
+            contents = json.load(fp)
+    except Exception:
+        return
+
+    if not isinstance(contents, dict) \
+        or contents.get('version') != SNAPSHOT_VERSION \
+        or contents.get('database') != list(database()):
+        return
+
+    try:
+        snapshot = {'version' : SNAPSHOT_VERSION, 'database' : database(),
+            'signatures' : dict([(x, tuple(y)) for x, y in contents['signatures'].items()]),
+            'tables' : dict([(x, decodeTable(y)) for x, y in contents['tables'].items()])}
+    except (TypeError, ValueError, KeyError, AttributeError):
+        snapshot = None
+
+# Purpose:  converts a table read from the snapshot file
+# Returns:  dictionary of key : value
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:  ValueError if a key or value is not a str. or integer
+
+def decodeTable(
+    pairs	# list of [key, value]
+    ):
+
+    table = {}
+
+    for key, value in pairs:
+        if not isinstance(key, (str, int)) or not isinstance(value, (str, int, type(None))):
+            raise ValueError('invalid snapshot entry')
+        table[key] = value
+
+    return table
+
+# Purpose:  rewrites the snapshot file
+# Returns:  nothing
+# Assumes:  the given tables have just been loaded from the database
+# Effects:  writes the snapshot file; the file is replaced atomically
+#	so loads starting in parallel never read a partial snapshot
+#	a snapshot that cannot be written is skipped
+# Throws:  nothing
+
+def writeSnapshot(
+    names,	# names of the tables loaded from the database (list)
+    signatures	# table name : signature
+    ):
+
+    global snapshot
+
+    if snapshot is None:
+        snapshot = {'version' : SNAPSHOT_VERSION, 'database' : database(),
+            'signatures' : {}, 'tables' : {}}
+
+    for x in names:
+        snapshot['signatures'][x] = signatures[x]
+        snapshot['tables'][x] = dict(tables[x].dictionary())
+
+    try:
+        fd, tmpName = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(snapshotFile)))
+        with os.fdopen(fd, 'w') as fp:
+            json.dump({'version' : snapshot['version'], 'database' : list(snapshot['database']),
+                'signatures' : snapshot['signatures'],
+                'tables' : dict([(x, list(y.items())) for x, y in snapshot['tables'].items()])}, fp)
+        os.chmod(tmpName, 0o664)
+        os.replace(tmpName, snapshotFile)
+    except OSError:
+        pass
+
+readSnapshot()